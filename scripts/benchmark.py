@@ -0,0 +1,1553 @@
+import itertools
+import os
+import sys
+import time
+from pathlib import Path
+
+
+project_folder = Path(__file__).resolve().parent.parent
+src_folder = project_folder / "src"
+
+if str(src_folder) not in sys.path:
+    sys.path.insert(0, str(src_folder))
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QEvent, QEventLoop, QObject, QRectF, Qt, QTimer
+from PyQt5.QtGui import QColor, QImage, QLinearGradient, QPainter
+from PyQt5.QtWidgets import QApplication
+
+
+FRAME_SIZE = (1920, 1080)
+OUTPUT_SIZE = 300
+FRAMES = 200
+
+
+def make_frame(width, height):
+    image = QImage(width, height, QImage.Format_RGB32)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(20, 120, 200))
+    gradient.setColorAt(1, QColor(240, 180, 40))
+
+    painter = QPainter(image)
+    painter.fillRect(0, 0, width, height, gradient)
+    painter.end()
+
+    return image
+
+
+def center_crop(width, height):
+    size = min(width, height)
+    return QRectF((width - size) // 2, (height - size) // 2, size, size)
+
+
+def measure(func, frames=FRAMES):
+    func()
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        func()
+    elapsed = time.perf_counter() - start
+
+    return frames / elapsed, elapsed / frames * 1000
+
+
+def report(name, fps, latency):
+    print(f"{name:<32} {fps:>10.1f} fps {latency:>10.3f} ms/frame")
+
+
+def image_to_array(image):
+    import numpy as np
+
+    image = image.convertToFormat(QImage.Format_ARGB32)
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    array = np.frombuffer(bits, np.uint8).reshape(image.height(), -1)
+    array = array[:, : image.width() * 4].reshape(image.height(), image.width(), 4)
+    return array.copy()
+
+
+def benchmark_mask():
+    from services.mask_engine import (
+        MaskEngine,
+        mask_image_painter,
+        MASK_THEN_SCALE,
+        SCALE_THEN_MASK,
+        QPAINTER_BACKEND,
+        NUMPY_BACKEND,
+    )
+
+    frame = make_frame(*FRAME_SIZE)
+    rect = center_crop(*FRAME_SIZE)
+    engine = MaskEngine()
+
+    report(
+        "mask: painter (per frame)",
+        *measure(lambda: mask_image_painter(frame, OUTPUT_SIZE, rect)),
+    )
+    report(
+        "mask: cached alpha",
+        *measure(lambda: engine.mask(frame, OUTPUT_SIZE, rect)),
+    )
+
+    for mode in (MASK_THEN_SCALE, SCALE_THEN_MASK):
+        engine.mode = mode
+        report(
+            f"mask: {mode}",
+            *measure(lambda: engine.mask(frame, OUTPUT_SIZE, rect)),
+        )
+
+    for backend in (QPAINTER_BACKEND, NUMPY_BACKEND):
+        engine.backend = backend
+        report(
+            f"mask: {backend} backend",
+            *measure(lambda: engine.mask(frame, OUTPUT_SIZE, rect)),
+        )
+
+    rect = QRectF(0, 0, OUTPUT_SIZE, OUTPUT_SIZE)
+    for backend in (QPAINTER_BACKEND, NUMPY_BACKEND):
+        engine.backend = backend
+        report(
+            f"mask: {backend} crop == output",
+            *measure(lambda: engine.mask(frame, OUTPUT_SIZE, rect)),
+        )
+
+
+def benchmark_quality():
+    import numpy as np
+
+    from services.mask_engine import (
+        MaskEngine,
+        MASK_THEN_SCALE,
+        SCALE_THEN_MASK,
+        NUMPY_BACKEND,
+    )
+
+    frame = make_frame(*FRAME_SIZE)
+    reference = MaskEngine(mode=MASK_THEN_SCALE)
+    radius, max_edge_distance = OUTPUT_SIZE / 2, 1.5
+    center = np.arange(OUTPUT_SIZE) + 0.5 - radius
+    distance = np.hypot(center[:, None], center)
+    engines = {
+        SCALE_THEN_MASK: MaskEngine(mode=SCALE_THEN_MASK),
+        NUMPY_BACKEND: MaskEngine(backend=NUMPY_BACKEND),
+    }
+
+    for (name, engine), crop in itertools.product(
+        engines.items(), (FRAME_SIZE[1] - 100, 600, OUTPUT_SIZE)
+    ):
+        rect = QRectF(100, 50, crop, crop)
+        expected = image_to_array(reference.mask(frame, OUTPUT_SIZE, rect))
+        actual = image_to_array(engine.mask(frame, OUTPUT_SIZE, rect))
+
+        # The circle edge is anti-aliased differently, so colors are
+        # compared only where both images are fully opaque.
+        opaque = (expected[..., 3] == 255) & (actual[..., 3] == 255)
+        diff = np.abs(expected.astype(int) - actual.astype(int))[..., :3][opaque]
+        alpha_diff = np.abs(expected[..., 3].astype(int) - actual[..., 3].astype(int))
+        # Alpha may only differ on the anti-aliased rim.
+        edge_distance = np.abs(radius - distance)[alpha_diff > 0].max(initial=0)
+
+        print(
+            f"quality: {name}, crop {crop:>4}px -> {OUTPUT_SIZE}px "
+            f"color max {diff.max():>3} mean {diff.mean():.3f}, "
+            f"alpha max {alpha_diff.max():>3} mean {alpha_diff.mean():.3f}, "
+            f"alpha differs up to {edge_distance:.2f}px from the edge"
+        )
+        assert diff.max() == 0, f"{name}: colors differ inside the circle"
+        assert alpha_diff.mean() < 1.5, f"{name}: alpha differs too much"
+        assert edge_distance <= max_edge_distance, f"{name}: alpha differs inside"
+
+    # Both backends multiply by the same cached mask.
+    qpainter, numpy_backend = engines.values()
+    for crop in (FRAME_SIZE[1] - 100, OUTPUT_SIZE):
+        rect = QRectF(100, 50, crop, crop)
+        expected = image_to_array(qpainter.mask(frame, OUTPUT_SIZE, rect))
+        actual = image_to_array(numpy_backend.mask(frame, OUTPUT_SIZE, rect))
+        assert np.array_equal(expected, actual), f"crop {crop}: backends differ"
+    print("quality: qpainter and numpy backends are pixel identical")
+
+
+def benchmark_burst(frames=100, process_ms=2):
+    # A burst of probed frames from a synthetic source through the real
+    # Camera.process_frame, with a frame worker slower than the burst.
+    from PyQt5.QtWidgets import QLabel
+
+    import main
+    from services.frame_sources import SyntheticFrameSource
+
+    app = QApplication.instance()
+    main.Config().frame_source = "synthetic"
+    camera = main.Camera.get(40)
+    camera.motion_detector.threshold = 0
+    mailbox, guard, scheduler = (
+        camera.worker.mailbox,
+        camera.frame_guard,
+        camera.scheduler,
+    )
+
+    depth = max_depth = 0
+    process_frame = camera.process_frame
+
+    def measure_depth(frame):
+        nonlocal depth, max_depth
+        depth += 1
+        max_depth = max(max_depth, depth)
+        try:
+            process_frame(frame)
+        finally:
+            depth -= 1
+
+    source = SyntheticFrameSource(320, 240, frame_count=4)
+    source.prerender()
+    camera.set_frame_source(source)
+    source.frame_ready.disconnect(process_frame)
+    source.frame_ready.connect(measure_depth)
+
+    processed, shown = [], []
+
+    def process(frame, size):
+        time.sleep(process_ms / 1000)
+        processed.append(frame)
+        return frame.image
+
+    label = QLabel()
+    label.show()
+    camera.add_source(label, process, None, None, shown.append)
+
+    def drain(count):
+        loop = QEventLoop()
+        QTimer.singleShot(200 + count * process_ms, loop.quit)
+        loop.exec_()
+
+    def burst(count):
+        # Queued probe signals, delivered in one event loop pass.
+        for _ in range(count):
+            QTimer.singleShot(0, source.emit_next_frame)
+        app.processEvents()
+        drain(count)
+
+    # A frame size listener that spins the event loop, as the resize path
+    # used to: the frames it delivers must not re-enter process_frame.
+    def spin_events(size):
+        app.processEvents()
+
+    camera.on_camera_size_changed.add(spin_events)
+    burst(10)
+    camera.on_camera_size_changed.remove(spin_events)
+    print(
+        f"burst: spinning size listener: max nesting depth {max_depth}, "
+        f"nested calls rejected {guard.avoided}, submitted {mailbox.posted}"
+    )
+    assert max_depth == 2 and guard.avoided == 9 and mailbox.posted == 1
+
+    depth = max_depth = 0
+    posted, dropped, avoided = mailbox.posted, mailbox.dropped, guard.avoided
+    coalesced, processed[:], shown[:] = scheduler.coalesced, [], []
+    # Frames arriving faster than the worker, while the GUI thread is too
+    # busy to show the results in between.
+    for _ in range(frames):
+        source.emit_next_frame()
+        time.sleep(process_ms / 4000)
+    drain(frames)
+    posted, dropped = mailbox.posted - posted, mailbox.dropped - dropped
+    coalesced = scheduler.coalesced - coalesced
+    print(
+        f"burst: {frames} frames: max nesting depth {max_depth}, "
+        f"submitted {posted} dropped {dropped} processed {len(processed)}, "
+        f"repaints coalesced {coalesced} shown {len(shown)}"
+    )
+    assert max_depth == 1 and guard.avoided == avoided
+    assert posted == frames and dropped == posted - len(processed) > 0
+    assert coalesced > 0 and len(shown) + coalesced == len(processed)
+
+    source.frame_ready.disconnect(measure_depth)
+    source.frame_ready.connect(process_frame)
+    camera.remove_source(label)
+
+
+def make_yuv_planes(width, height, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    luma = rng.integers(16, 236, (height, width), dtype=np.uint8)
+    u = rng.integers(16, 241, (height // 2, width // 2), dtype=np.uint8)
+    v = rng.integers(16, 241, (height // 2, width // 2), dtype=np.uint8)
+
+    yuyv = np.empty((height, width // 2, 4), np.uint8)
+    yuyv[..., 0] = luma[:, 0::2]
+    yuyv[..., 1] = u.repeat(2, axis=0)
+    yuyv[..., 2] = luma[:, 1::2]
+    yuyv[..., 3] = v.repeat(2, axis=0)
+
+    uv = np.empty((height // 2, width), np.uint8)
+    uv[:, 0::2] = u
+    uv[:, 1::2] = v
+
+    return {
+        "yuyv": ([yuyv.ravel()], [width * 2]),
+        "nv12": ([luma.ravel(), uv.ravel()], [width, width]),
+    }
+
+
+def benchmark_yuv():
+    import numpy as np
+    from PyQt5.QtCore import QRect
+    from PyQt5.QtMultimedia import QVideoFrame
+
+    from services.decoded_frame import DecodedFrame
+    from services.frame_sources import video_frame_from_bytes
+    from services.yuv import align_rect, crop_nv12, crop_yuyv, yuv_to_image
+
+    width, height = FRAME_SIZE
+    rect = align_rect(center_crop(width, height).toRect())
+    formats = {
+        "yuyv": (QVideoFrame.Format_YUYV, crop_yuyv),
+        "nv12": (QVideoFrame.Format_NV12, crop_nv12),
+    }
+
+    for name, (planes, strides) in make_yuv_planes(width, height).items():
+        pixel_format, cropper = formats[name]
+        frame = video_frame_from_bytes(
+            np.concatenate(planes), width, height, strides[0], pixel_format
+        )
+
+        def qt_decode_then_crop():
+            return frame.image().copy(rect)
+
+        def numpy_crop_then_convert():
+            return yuv_to_image(*cropper(planes, strides, height, rect))
+
+        def decoded_frame_crop():
+            with DecodedFrame(frame) as decoded:
+                image, inner = decoded.crop(rect)
+                return image.copy(inner)
+
+        expected = image_to_array(qt_decode_then_crop())
+        for convert in (numpy_crop_then_convert, decoded_frame_crop):
+            actual = image_to_array(convert())
+            assert np.array_equal(expected, actual), f"{name}: crop differs"
+
+        # The whole frame has to go through Qt's converter.
+        with DecodedFrame(frame) as decoded:
+            image, _ = decoded.crop(QRect(0, 0, width, height))
+            assert decoded.stats.native_crops == 0, f"{name}: full frame cropped"
+
+        report(f"yuv {name}: Qt decode, then crop", *measure(qt_decode_then_crop, 20))
+        report(f"yuv {name}: NumPy crop", *measure(numpy_crop_then_convert, 20))
+        report(f"yuv {name}: DecodedFrame.crop", *measure(decoded_frame_crop, 20))
+
+
+def benchmark_sources(camera_fps=60, seconds=10):
+    import random
+
+    from services.source_entry import SourceEntry
+
+    random.seed(0)
+    entries = {
+        "circle (unlimited)": SourceEntry(None),
+        "preview (15 fps)": SourceEntry(None, fps=15),
+        "hidden window": SourceEntry(None),
+    }
+
+    for index in range(camera_fps * seconds):
+        now = index / camera_fps + random.uniform(-0.004, 0.004)
+        for name, entry in entries.items():
+            if entry.schedule(name != "hidden window", now):
+                entry.deliver()
+
+    for name, entry in entries.items():
+        stats = entry.stats()
+        print(
+            f"sources: {name:<20} delivered {stats['delivered']:>4} "
+            f"skipped {stats['skipped']:>4} hidden {stats['hidden']:>4}"
+        )
+
+    # The limited source may gain one frame from jitter at the edges, never more.
+    frames = camera_fps * seconds
+    delivered = {name: entry.stats()["delivered"] for name, entry in entries.items()}
+    assert delivered["circle (unlimited)"] == frames, delivered
+    assert 0.9 * 15 * seconds <= delivered["preview (15 fps)"] <= 15 * seconds + 1
+    assert delivered["hidden window"] == 0, delivered
+
+
+def benchmark_viewfinder():
+    from services.viewfinder import (
+        ViewfinderMode,
+        required_frame_side,
+        select_viewfinder_mode,
+    )
+
+    modes = [
+        ViewfinderMode(width, height, 5, fps)
+        for width, height in ((640, 480), (1280, 720), (1920, 1080))
+        for fps in (15, 30, 60)
+    ]
+
+    def select(side, fps=30, resolution=None, modes=modes):
+        mode = select_viewfinder_mode(modes, side, fps, resolution)
+        return mode and (mode.width, mode.height, mode.max_fps)
+
+    expected = {
+        (200, 1.0): (640, 480, 30),
+        (300, 1.0): (640, 480, 30),
+        (300, 0.5): (1280, 720, 30),
+        (800, 1.0): (1920, 1080, 30),
+    }
+    for (output_size, crop_fraction), size in expected.items():
+        mode = select(required_frame_side(output_size, crop_fraction))
+        assert mode == size, (output_size, crop_fraction, mode)
+        print(
+            f"viewfinder: {output_size}px circle, crop {crop_fraction:.0%} "
+            f"-> {mode[0]}x{mode[1]}@{mode[2]}"
+        )
+
+    # Device pixels count, and nothing large enough takes the largest mode.
+    assert select(required_frame_side(300, 1.0, 2.0)) == (1280, 720, 30)
+    assert select(4000) == (1920, 1080, 30)
+    assert select(480, resolution=None, modes=[]) is None
+
+    # capture_resolution wins over the crop, unless the camera lacks it.
+    assert select(1600, resolution=(640, 480)) == (640, 480, 30)
+    assert select(480, resolution=(1024, 768)) == (640, 480, 30)
+
+    # The slowest mode reaching the frame rate, else the fastest one.
+    assert select(480, fps=25) == (640, 480, 30)
+    assert select(480, fps=90) == (640, 480, 60)
+    slow = [ViewfinderMode(1920, 1080, 5, fps) for fps in (15, 24)]
+    assert select(480, modes=slow) == (1920, 1080, 24)
+    assert select(480, resolution=(1920, 1080), modes=slow) == (1920, 1080, 24)
+
+    benchmark_viewfinder_crop()
+
+
+def benchmark_viewfinder_crop(width=1280, height=720):
+    # A narrower crop renegotiates once it settles, and the resolution
+    # switch that follows keeps the crop in the circle and in the editor.
+    import tempfile
+
+    import main
+    from services.frame_sources import SyntheticFrameSource
+
+    app = QApplication.instance()
+    config_file = Path(tempfile.mkdtemp()) / "config.ini"
+    config_file.write_text(
+        f"[DEFAULT]\ncamera_id = 46\nsize = 200\nframe_source = synthetic\n"
+        f"capture_resolution = {width}x{height}\n"
+    )
+    main.Config().config_file = config_file
+    main.app = app
+    window = main.MainWindow()
+    window.show()
+    camera = window.camera_widget.camera
+    settings = window.get_setting_window()
+    settings.show()
+
+    assert wait_for(lambda: settings.camera_resize_item is not None)
+    requests = []
+    camera.negotiate_viewfinder = lambda *request: requests.append(request)
+
+    frame_rect = QRectF(0, 0, width, height)
+    for x in range(300, 420, 20):
+        window.crop_rect.publish(QRectF(x, 100, 360, 360), frame_rect)
+    assert wait_for(lambda: requests)
+    wait_for(lambda: False, main.VIEWFINDER_SETTLE_MS * 2 / 1000)
+    assert len(requests) == 1 and requests[0][:2] == (200, 0.5), requests
+
+    camera.set_frame_source(SyntheticFrameSource(width * 3 // 2, height * 3 // 2))
+    assert wait_for(lambda: camera.frame_size.width() == width * 3 // 2)
+    snapshot = window.crop_rect.snapshot
+    assert snapshot.rect.getRect() == (600, 150, 540, 540), snapshot
+    assert snapshot.crop_fraction == 0.5
+
+    item = settings.camera_resize_item
+    assert item.frame_rect == QRectF(0, 0, width * 3 // 2, height * 3 // 2)
+    edited = main.scale_rect(item.get_crop_rect(), item.frame_scale).getRect()
+    assert all(abs(a - b) <= 3 for a, b in zip(edited, snapshot.rect.getRect()))
+    print(
+        f"viewfinder: crop {requests[0][1]:.0%} renegotiated once after "
+        f"{len(range(300, 420, 20))} moves, {width}x{height} -> "
+        f"{camera.frame_size.width()}x{camera.frame_size.height()} keeps crop "
+        f"{snapshot.rect.getRect()}, editor {tuple(round(v) for v in edited)}"
+    )
+
+    for widget in (settings, window):
+        widget.close()
+
+
+def wait_for(condition, seconds=5):
+    app = QApplication.instance()
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents(QEventLoop.AllEvents, 50)
+    return condition()
+
+
+def wait_for_display(app, instrumentation, displayed):
+    while instrumentation.counters.get("frames_displayed", 0) == displayed:
+        app.processEvents(QEventLoop.WaitForMoreEvents)
+
+
+def benchmark_pipeline(frames=120, resolutions=((1280, 720), (1920, 1080))):
+    # Full path: frame source -> Camera.process_frame -> worker -> mask_image
+    # -> setPixmap, driven frame by frame without any camera hardware.
+    from PyQt5.QtWidgets import QLabel
+
+    import main
+    from services.frame_sources import PIXEL_FORMATS, SyntheticFrameSource
+    from services.mask_engine import BACKENDS
+
+    app = QApplication.instance()
+    main.Config().frame_source = "synthetic"
+    camera = main.Camera.get()
+    instrumentation = main.instrumentation
+
+    label = QLabel()
+    label.show()
+
+    configurations = itertools.product(resolutions, PIXEL_FORMATS, BACKENDS)
+    for (width, height), pixel_format, backend in configurations:
+        main.mask_engine.backend = backend
+        source = SyntheticFrameSource(
+            width, height, pixel_format=PIXEL_FORMATS[pixel_format], frame_count=8
+        )
+        source.prerender()
+        camera.set_frame_source(source)
+
+        rect = center_crop(width, height)
+        camera.add_source(
+            label,
+            lambda frame, size: main.mask_image(frame, size[0], rect),
+            (OUTPUT_SIZE, OUTPUT_SIZE),
+        )
+
+        instrumentation.enable()
+        instrumentation.reset()
+        start = time.perf_counter()
+        for displayed in range(frames):
+            source.emit_next_frame()
+            wait_for_display(app, instrumentation, displayed)
+        elapsed = time.perf_counter() - start
+
+        latency = instrumentation.summary()["stages"]["capture_to_display"]
+        print(
+            f"pipeline: {width}x{height} {pixel_format:<5} {backend:<8} "
+            f"{frames / elapsed:>8.1f} fps, capture to display "
+            f"p50 {latency['p50_ms']:.2f} ms p95 {latency['p95_ms']:.2f} ms"
+        )
+
+    instrumentation.enable(False)
+    camera.remove_source(label)
+
+
+def benchmark_display():
+    from PyQt5.QtGui import QPixmap
+    from PyQt5.QtWidgets import QLabel
+
+    import main
+
+    frame = make_frame(*FRAME_SIZE)
+    rect = center_crop(*FRAME_SIZE)
+
+    # Widgets are rendered into an image, offscreen windows are never exposed.
+    target = QImage(OUTPUT_SIZE, OUTPUT_SIZE, QImage.Format_ARGB32_Premultiplied)
+
+    label = QLabel()
+    label.resize(OUTPUT_SIZE, OUTPUT_SIZE)
+
+    def show_in_label():
+        image = main.mask_engine.mask(frame, OUTPUT_SIZE, rect)
+        label.setPixmap(QPixmap.fromImage(image))
+        label.render(target)
+
+    widget = main.CircleFrameWidget()
+    widget.resize(OUTPUT_SIZE, OUTPUT_SIZE)
+
+    def show_in_widget():
+        widget.set_frame((frame, rect, 1))
+        widget.render(target)
+
+    report("display: mask + QLabel.setPixmap", *measure(show_in_label))
+    report("display: CircleFrameWidget", *measure(show_in_widget))
+
+    # The transform follows the crop version, or the rect of a tracked face.
+    transform = widget.transform
+    widget.set_frame((frame, rect, 1))
+    widget.render(target)
+    assert widget.transform is transform
+    for moved in ((frame, rect.translated(10, 0), 2), (frame, rect, None)):
+        widget.set_frame(moved)
+        widget.render(target)
+        assert widget.transform is not transform
+        transform = widget.transform
+
+
+def resident_memory():
+    # Current RSS in MiB where /proc is available, peak RSS otherwise.
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark_pool(frames=3000, sample_every=250, max_growth_mib=8.0):
+    # Soak test of the mask -> pixmap path: with the pool the resident memory
+    # should stay flat after warm-up instead of following the allocator.
+    from PyQt5.QtGui import QPixmap
+
+    from services.image_pool import ImagePool
+    from services.mask_engine import MaskEngine
+
+    frame = make_frame(*FRAME_SIZE)
+    rect = center_crop(*FRAME_SIZE)
+
+    for name, pool in (("no pool", None), ("pool", ImagePool())):
+        engine = MaskEngine(pool=pool)
+
+        def show():
+            image = engine.mask(frame, OUTPUT_SIZE, rect)
+            QPixmap.fromImage(image)
+            if pool is not None:
+                pool.release(image)
+
+        samples = []
+        warm_up = frames // 4
+        start = time.perf_counter()
+        for index in range(frames):
+            show()
+            if index % sample_every == 0:
+                samples.append(resident_memory())
+            if pool is not None and index == warm_up:
+                warm = pool.stats()
+        elapsed = time.perf_counter() - start
+
+        settled = samples[len(samples) // 4 :]
+        growth = max(settled) - settled[0]
+        report(f"pool: {name}", frames / elapsed, elapsed / frames * 1000)
+        print(
+            f"pool: {name}, rss {samples[0]:.1f} -> {samples[-1]:.1f} MiB, "
+            f"growth after warm-up {growth:.2f} MiB"
+        )
+        if pool is None:
+            continue
+
+        stats = pool.stats()
+        hits = stats["hits"] - warm["hits"]
+        misses = stats["misses"] - warm["misses"]
+        print(f"pool: {stats}, hit rate after warm-up {hits / (hits + misses):.3f}")
+        assert hits / (hits + misses) >= 0.99, stats
+        assert growth <= max_growth_mib, samples
+
+
+def benchmark_metrics():
+    from PyQt5.QtGui import QWindow
+    from PyQt5.QtMultimedia import QVideoFrame
+
+    import main
+    from services.decoded_frame import DecodedFrame
+
+    metrics = main.display_metrics
+    frame = QVideoFrame(make_frame(*FRAME_SIZE))
+    rect = center_crop(*FRAME_SIZE)
+
+    report(
+        "metrics: QWindow per frame",
+        *measure(lambda: QWindow().devicePixelRatio(), 1000),
+    )
+    report(
+        "metrics: cached ratio",
+        *measure(lambda: metrics.device_pixel_ratio, 1000),
+    )
+
+    # A circle and an overlay on another camera, the overlay moved to a
+    # HiDPI screen: only the overlay's ratio changes, and only pooled
+    # circles of its previous size are dropped.
+    import tempfile
+
+    from PyQt5.QtCore import QSize
+
+    config_file = Path(tempfile.mkdtemp()) / "config.ini"
+    config_file.write_text(
+        "[DEFAULT]\ncamera_id = 44\nsize = 200\nframe_source = synthetic\n"
+        "overlay_cameras = 45\n"
+    )
+    main.Config().config_file = config_file
+    main.app = QApplication.instance()
+    window = main.MainWindow()
+    overlay = window.overlays[0]
+    assert window.display_metrics is metrics
+    assert overlay.display_metrics is not metrics
+
+    pool = main.image_pool
+    pool.clear()
+    for side in (200, 400):
+        pool.release(pool.acquire(side, side, QImage.Format_ARGB32_Premultiplied))
+    window.camera_widget.camera.reset_buffers(QSize(640, 480))
+    assert len(pool) == 2, pool.stats()
+
+    overlay.display_metrics.update(2.0)
+    assert metrics.device_pixel_ratio == 1.0
+    assert overlay.display_metrics.device_pixel_ratio == 2.0
+    assert len(pool) == 1, pool.stats()
+
+    for ratio in (
+        metrics.device_pixel_ratio,
+        overlay.display_metrics.device_pixel_ratio,
+    ):
+        image = main.mask_image(DecodedFrame(frame), OUTPUT_SIZE, rect, ratio)
+        assert image.width() == OUTPUT_SIZE * ratio
+        print(f"metrics: ratio {ratio}, output {image.width()}px, pool {len(pool)}")
+
+    for widget in (overlay, window):
+        widget.close()
+
+
+def benchmark_crop():
+    import main
+
+    item = main.CameraResizeRectWidget(QRectF(0, 0, *FRAME_SIZE))
+    crop_rect = item.crop_rect
+
+    report("crop: resize item crop rect", *measure(item.get_crop_rect, 10000))
+    report("crop: snapshot rect", *measure(lambda: crop_rect.snapshot.rect, 10000))
+
+    versions = [crop_rect.snapshot.version]
+    item.move_markers((100, 50))
+    item.publish_rect()
+    versions.append(crop_rect.snapshot.version)
+    item.publish_rect()
+    versions.append(crop_rect.snapshot.version)
+    print(
+        f"crop: versions after create, move, unchanged publish {versions}, "
+        f"rect {crop_rect.snapshot.rect.getRect()}"
+    )
+
+
+def benchmark_editor(drags=200):
+    # Synthetic marker drags in the crop editor over a 1080p preview, shown
+    # in a real view, with and without camera frames arriving underneath.
+    from PyQt5.QtGui import QPixmap
+    from PyQt5.QtWidgets import QGraphicsPixmapItem, QGraphicsScene, QGraphicsView
+
+    import main
+
+    app = QApplication.instance()
+    paints = []
+
+    class CountingResizeRectWidget(main.CameraResizeRectWidget):
+        def paint(self, painter, option, widget):
+            start = time.perf_counter()
+            super().paint(painter, option, widget)
+            paints.append(time.perf_counter() - start)
+
+    frames = [QPixmap.fromImage(make_frame(*FRAME_SIZE)) for _ in range(2)]
+    scene = QGraphicsScene()
+    camera_image = QGraphicsPixmapItem(frames[0])
+    scene.addItem(camera_image)
+    item = CountingResizeRectWidget(QRectF(0, 0, *FRAME_SIZE))
+    scene.addItem(item)
+
+    view = QGraphicsView(scene)
+    view.resize(FRAME_SIZE[0] + 20, FRAME_SIZE[1] + 20)
+
+    repainted = []
+
+    class PaintRegionFilter(QObject):
+        def eventFilter(self, source, event):
+            if event.type() == QEvent.Paint:
+                rects = event.region().rects()
+                repainted.append(sum(rect.width() * rect.height() for rect in rects))
+            return False
+
+    region_filter = PaintRegionFilter()
+    view.viewport().installEventFilter(region_filter)
+    view.show()
+    app.processEvents()
+
+    for with_frames in (False, True):
+        paints.clear()
+        repainted.clear()
+        start = time.perf_counter()
+        for index in range(drags):
+            # The bottom right marker goes in and out by up to 300 px.
+            offset = 3 if (index // 100) % 2 else -3
+            x, y = item.marker_2.position
+            item.marker_2.position = (x + offset, y + offset)
+            item.update_size_with_marker(2)
+            if with_frames:
+                camera_image.setPixmap(frames[index % 2])
+            app.processEvents()
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"editor: {'with frames' if with_frames else 'static':<11} "
+            f"{elapsed / drags * 1000:6.2f} ms/drag, "
+            f"{len(paints) / drags:.2f} editor paints/drag, "
+            f"{sum(paints) / drags * 1000:.3f} ms painting/drag, "
+            f"{sum(repainted) / drags / 1000:.0f} kpx repainted/drag"
+        )
+
+    view.close()
+
+    # The minimum crop holds in frame pixels whatever the preview scale.
+    frame_rect = QRectF(0, 0, *FRAME_SIZE)
+    for preview_width in (FRAME_SIZE[0], 640):
+        preview = QRectF(0, 0, preview_width, preview_width * 9 / 16)
+        scale = FRAME_SIZE[0] / preview_width
+        side = main.CameraResizeRectWidget.MARKER_DISTANCE / scale
+        for factor, movable in ((1.1, True), (0.9, False)):
+            square = QRectF(10, 10, side * factor, side * factor)
+            item = main.CameraResizeRectWidget(preview, None, frame_rect, square)
+            assert item.is_marker_can_move() is movable, (preview_width, factor)
+
+
+def benchmark_preview(preview_width=640):
+    # The settings preview per frame: conversion plus pixmap upload, at
+    # sensor resolution and reduced to the view.
+    import numpy as np
+    from PyQt5.QtGui import QPixmap
+
+    import main
+    from services.decoded_frame import DecodedFrame
+    from services.frame_sources import PIXEL_FORMATS, make_pattern, video_frame_from_rgb
+
+    width, height = FRAME_SIZE
+    preview_size = (preview_width, preview_width * height // width)
+    rgb = make_pattern(width, height, "gradient")
+
+    for name, pixel_format in PIXEL_FORMATS.items():
+        frame = video_frame_from_rgb(rgb, pixel_format)
+
+        def full_resolution():
+            with DecodedFrame(frame) as decoded:
+                return QPixmap.fromImage(decoded.image)
+
+        def qt_scaled():
+            return QPixmap.fromImage(frame.image().scaled(*preview_size))
+
+        def reduced():
+            with DecodedFrame(frame) as decoded:
+                return QPixmap.fromImage(decoded.preview(*preview_size))
+
+        with DecodedFrame(frame) as decoded:
+            actual = image_to_array(decoded.preview(*preview_size))
+        expected = image_to_array(frame.image().scaled(*preview_size))
+        assert np.array_equal(expected, actual), f"{name}: preview differs"
+
+        size = f"{preview_size[0]}x{preview_size[1]}"
+        report(f"preview {name}: sensor resolution", *measure(full_resolution, 20))
+        report(f"preview {name}: image.scaled {size}", *measure(qt_scaled, 20))
+        report(f"preview {name}: DecodedFrame.preview", *measure(reduced, 20))
+
+    # Markers are edited on the preview, the published crop is in sensor
+    # pixels.
+    item = main.CameraResizeRectWidget(
+        QRectF(0, 0, *preview_size), frame_rect=QRectF(0, 0, width, height)
+    )
+    default = item.crop_rect.snapshot.rect.getRect()
+    item.move_markers((100, 0))
+    item.publish_rect()
+    print(
+        f"preview: default crop {default}, crop at preview (100, 0) "
+        f"{item.crop_rect.snapshot.rect.getRect()}"
+    )
+
+
+def benchmark_tracking(frames=90, budget_ms=4.0):
+    # Recorded synthetic sequences of the "face" pattern, whose position is
+    # known for every frame.
+    import numpy as np
+
+    from services.decoded_frame import DecodedFrame
+    from services.face_tracker import FaceTracker, thumbnail_step
+    from services.frame_sources import (
+        PIXEL_FORMATS,
+        face_position,
+        make_pattern,
+        video_frame_from_rgb,
+    )
+
+    for (width, height), pixel_format in itertools.product(
+        ((1280, 720), (1920, 1080)), PIXEL_FORMATS
+    ):
+        rng = np.random.default_rng(0)
+        sequence = [
+            video_frame_from_rgb(
+                make_pattern(width, height, "face", index, rng),
+                PIXEL_FORMATS[pixel_format],
+            )
+            for index in range(30)
+        ]
+
+        tracker = FaceTracker()
+        step = thumbnail_step(width)
+        timings, errors = [], []
+        for index in range(frames):
+            start = time.perf_counter()
+            with DecodedFrame(sequence[index % 30]) as frame:
+                rect = tracker.update(*frame.thumbnail(step), step, width, height)
+            timings.append((time.perf_counter() - start) * 1000)
+
+            if rect is not None:
+                center_x, center_y = face_position(width, height, index)[:2]
+                error = np.hypot(
+                    rect.center().x() - center_x, rect.center().y() - center_y
+                )
+                errors.append(error / width)
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95)]
+        print(
+            f"tracking: {width}x{height} {pixel_format:<5} "
+            f"mean {np.mean(timings):.2f} ms p95 {p95:.2f} ms "
+            f"max {timings[-1]:.2f} ms ({budget_ms} ms budget), "
+            f"center error {np.mean(errors):.1%} of width, {tracker.stats()}"
+        )
+        assert np.mean(timings) <= budget_ms, f"{width}x{height} {pixel_format}"
+
+    # A reset from the GUI thread only takes effect at the start of the next
+    # update on the worker, never halfway through one.
+    tracker.request_reset()
+    assert tracker.box is not None and tracker.frame_index == frames
+    with DecodedFrame(sequence[0]) as frame:
+        tracker.update(*frame.thumbnail(step), step, width, height)
+    assert tracker.frame_index == 1, tracker.frame_index
+
+
+def benchmark_motion(frames=300, fps=30):
+    # CPU time of the mask -> pixmap path at camera rate, for a still scene
+    # with sensor noise and a moving one, with and without change detection.
+    import numpy as np
+    from PyQt5.QtGui import QPixmap
+
+    from services.decoded_frame import DecodedFrame
+    from services.face_tracker import thumbnail_step
+    from services.frame_sources import make_pattern, video_frame_from_rgb
+    from services.mask_engine import MaskEngine
+    from services.motion_detector import MOTION_THUMBNAIL_WIDTH, MotionDetector
+
+    width, height = 1280, 720
+    rect = center_crop(width, height)
+    step = thumbnail_step(width, MOTION_THUMBNAIL_WIDTH)
+    engine = MaskEngine()
+
+    rng = np.random.default_rng(0)
+    scenes = {
+        # Same picture, new noise in every frame.
+        "still": [make_pattern(width, height, "face", 0, rng) for _ in range(30)],
+        "moving": [
+            make_pattern(width, height, "face", index, rng) for index in range(30)
+        ],
+    }
+
+    for (scene, pictures), threshold in itertools.product(scenes.items(), (0, 6.0)):
+        sequence = [video_frame_from_rgb(picture) for picture in pictures]
+        detector = MotionDetector(threshold)
+
+        start = time.process_time()
+        for index in range(frames):
+            with DecodedFrame(sequence[index % len(sequence)]) as frame:
+                if threshold:
+                    luma = frame.thumbnail(step)[0]
+                    if not detector.has_changed(luma, index / fps):
+                        continue
+
+                image, crop = frame.crop(rect)
+                QPixmap.fromImage(engine.mask(image, OUTPUT_SIZE, crop))
+        cpu = time.process_time() - start
+
+        stats = detector.stats()
+        shown = frames - stats["unchanged"]
+        print(
+            f"motion: {scene:<6} threshold {threshold:>3}: "
+            f"{cpu / frames * 1000:6.2f} ms cpu/frame, "
+            f"{shown * fps / frames:5.1f} of {fps} fps shown"
+        )
+
+    # The scene changes once, on a frame the 15 fps preview skips: the
+    # preview still has to show it on its next frame.
+    import main
+    from services.source_entry import SourceEntry
+
+    main.Config().frame_source = "synthetic"
+    camera = main.Camera.get(41)
+    camera.motion_detector = MotionDetector(6.0, min_refresh_interval=60)
+    still, moved = (video_frame_from_rgb(scenes["moving"][index]) for index in (0, 9))
+    circle, preview = SourceEntry(None), SourceEntry(None, fps=fps / 2)
+    for entry in (circle, preview):
+        entry.process = lambda frame, size: frame.image
+
+    shown = {circle: [], preview: []}
+    for index in range(12):
+        now = index / fps
+        sources = [
+            (entry, entry) for entry in (circle, preview) if entry.schedule(True, now)
+        ]
+        frame = still if index < 5 else moved
+        for entry, _, _ in camera.process_sources(frame, sources, now):
+            shown[entry].append(index)
+
+    assert shown[circle] == [0, 5], shown[circle]
+    assert shown[preview] == [0, 6], shown[preview]
+    assert preview.delivered == 2 and preview.unchanged == 4, preview.stats()
+    assert circle.delivered == 2 and circle.unchanged == 10, circle.stats()
+    print(
+        f"motion: change on frame 5 shown by the circle at {shown[circle]}, "
+        f"by the 15 fps preview at {shown[preview]}"
+    )
+
+
+def benchmark_cameras(seconds=3, slow_ms=80, devices=(30, 31, 32)):
+    # Three synthetic devices, the first shown in two windows. The last one
+    # gets a slow process function, which must not slow down the others.
+    # The devices are used by no other benchmark, so none is left running.
+    from PyQt5.QtWidgets import QLabel
+
+    import main
+
+    config = main.Config()
+    saved = config.frame_source, config.motion_threshold
+    config.frame_source = "synthetic"
+    config.motion_threshold = 0
+
+    def run(slow):
+        # Devices left without a window may have been closed since.
+        cameras = [main.Camera.get(camera_id) for camera_id in devices]
+        assert main.Camera.get(devices[0]) is cameras[0]
+        for camera in cameras:
+            camera.frame_source.prerender()
+
+        shown = {}
+        labels = []
+        for camera in cameras:
+            windows = 2 if camera is cameras[0] else 1
+            for index in range(windows):
+                name = f"camera {camera.camera_id} window {index}"
+                shown[name] = 0
+
+                def process(frame, size, camera=camera):
+                    if slow and camera is cameras[-1]:
+                        time.sleep(slow_ms / 1000)
+                    return frame.image
+
+                def display(image, name=name):
+                    shown[name] += 1
+
+                label = QLabel()
+                label.show()
+                labels.append((camera, label))
+                camera.add_source(label, process, None, None, display)
+            camera.start(labels[-1][1])
+
+        loop = QEventLoop()
+        QTimer.singleShot(seconds * 1000, loop.quit)
+        loop.exec_()
+
+        for camera, label in labels:
+            camera.stop(label)
+            camera.remove_source(label)
+
+        rates = {name: count / seconds for name, count in shown.items()}
+        print(
+            f"cameras: {'slow' if slow else 'all fast'}: "
+            + ", ".join(f"{name} {rate:.1f}" for name, rate in rates.items())
+            + " fps"
+        )
+        return rates
+
+    try:
+        fast = run(slow=False)
+        slow = run(slow=True)
+    finally:
+        config.frame_source, config.motion_threshold = saved
+        for camera_id in devices:
+            main.Camera.sessions.discard(camera_id)
+
+    slow_camera = f"camera {devices[-1]}"
+    for name, rate in fast.items():
+        if not name.startswith(slow_camera):
+            assert slow[name] >= 0.8 * rate, (name, rate, slow[name])
+    assert slow[f"{slow_camera} window 0"] <= 1.2 * 1000 / slow_ms
+
+
+def benchmark_leases(toggles=20, linger=300):
+    # A circle and a settings preview sharing one synthetic device, hidden
+    # and shown like the tray menu does it.
+    from PyQt5.QtWidgets import QLabel
+
+    import main
+
+    app = QApplication.instance()
+    config = main.Config()
+    config.frame_source = "synthetic"
+    camera = main.Camera.get(10)
+    lifecycle = camera.lifecycle
+
+    def wait(milliseconds):
+        loop = QEventLoop()
+        QTimer.singleShot(milliseconds, loop.quit)
+        loop.exec_()
+
+    def check(step, running, starts, stops):
+        stats = lifecycle.stats()
+        actual = (camera.frame_source.is_active(), stats["starts"], stats["stops"])
+        assert actual == (running, starts, stops), f"{step}: {actual}, {stats}"
+
+    # Hidden labels: bound to the device, but given no frames.
+    circle, preview = QLabel(), QLabel()
+    camera.add_source(circle)
+    camera.add_source(preview)
+    lifecycle.linger = linger
+    camera.start(circle)
+    camera.start(preview)
+    check("both shown", True, 1, 0)
+    camera.set_consumer_visible(circle, False)
+    camera.stop(preview)
+    check("both hidden, lingering", True, 1, 0)
+    wait(linger // 3)
+    camera.set_consumer_visible(circle, True)
+    wait(linger * 2)
+    check("circle shown again within the linger", True, 1, 0)
+    camera.stop(circle)
+    wait(linger * 2)
+    check("all released", False, 1, 1)
+
+    for lifecycle.linger in (0, linger):
+        starts = lifecycle.starts
+        start = time.perf_counter()
+        for _ in range(toggles):
+            camera.start(circle)
+            app.processEvents()
+            camera.stop(circle)
+            app.processEvents()
+        elapsed = time.perf_counter() - start
+        wait(linger * 2)
+        print(
+            f"leases: linger {lifecycle.linger:>3} ms: {toggles} hide/show toggles, "
+            f"{lifecycle.starts - starts} device starts, {elapsed * 1000:.1f} ms"
+        )
+
+    print(f"leases: {lifecycle.stats()}")
+    camera.remove_source(circle)
+    camera.remove_source(preview)
+
+
+def benchmark_switching(switches=10, devices=(20, 21, 22)):
+    # Switches a circle between synthetic devices like the settings combo box
+    # does, with and without warm sessions. Measures the switch itself and
+    # the time to the first frame of the new device, and checks that only
+    # that one still delivers. Synthetic devices open instantly, real ones
+    # take far longer to open than to restart.
+    import main
+
+    app = QApplication.instance()
+    config = main.Config()
+    config.frame_source = "synthetic"
+    config.motion_threshold = 0
+    # Small cheap frames, so rendering them doesn't hide the switch.
+    resolution, pattern = config.capture_resolution, config.synthetic_pattern
+    config.capture_resolution, config.synthetic_pattern = "320x240", "gradient"
+    shown = []
+
+    def wait_for_frame(timeout=2.0):
+        deadline = time.perf_counter() + timeout
+        count = len(shown)
+        while len(shown) == count and time.perf_counter() < deadline:
+            app.processEvents(QEventLoop.WaitForMoreEvents, 10)
+        assert len(shown) > count, "no frame after the switch"
+
+    def active_probes():
+        return [
+            camera_id
+            for camera_id, camera in main.Camera.sessions
+            if camera.frame_source.is_active()
+        ]
+
+    widget = main.CameraSource(
+        devices[0], size=(300, 300), display=lambda image: shown.append(image)
+    )
+    widget.set_process_pixmap(lambda frame, size: frame.image)
+    widget.show()
+    widget.start_camera()
+    wait_for_frame()
+
+    for warm in (0, len(devices)):
+        main.Camera.sessions.warm = warm
+        main.Camera.sessions.trim()
+        opened = main.Camera.sessions.opened
+        switch_times, latencies = [], []
+        for index in range(1, switches + 1):
+            camera_id = devices[index % len(devices)]
+            start = time.perf_counter()
+            widget.change_camera_id(camera_id)
+            switch_times.append(time.perf_counter() - start)
+            wait_for_frame()
+            latencies.append(time.perf_counter() - start)
+            probes = active_probes()
+            assert probes == [camera_id], f"active probes {probes}, not {camera_id}"
+
+        print(
+            f"switching: {warm} warm: {switches} switches, "
+            f"{main.Camera.sessions.opened - opened} devices opened, "
+            f"switch {sum(switch_times) / switches * 1000:.2f} ms, "
+            f"first frame mean {sum(latencies) / switches * 1000:.1f} ms "
+            f"max {max(latencies) * 1000:.1f} ms, one active probe"
+        )
+
+    widget.stop_camera()
+    widget.camera.remove_source(widget.camera_source_widget)
+    config.capture_resolution, config.synthetic_pattern = resolution, pattern
+    print(f"switching: {main.Camera.sessions.stats()}")
+
+
+def benchmark_settings():
+    # Saving from an overlay's settings keeps the main camera and only moves
+    # that overlay's entry.
+    import configparser
+    import tempfile
+
+    import main
+
+    config_file = Path(tempfile.mkdtemp()) / "config.ini"
+    config_file.write_text(
+        "[DEFAULT]\ncamera_id = 47\nsize = 200\nframe_source = synthetic\n"
+        "overlay_cameras = 48, 49\n"
+    )
+    main.Config().config_file = config_file
+    main.app = QApplication.instance()
+    window = main.MainWindow()
+
+    def saved():
+        config = configparser.ConfigParser()
+        config.read(config_file)
+        return config["DEFAULT"]["camera_id"], config["DEFAULT"]["overlay_cameras"]
+
+    settings = window.overlays[1].get_setting_window()
+    settings.camera_id = 50
+    settings.save_config()
+    assert saved() == ("47", "48, 50"), saved()
+
+    settings = window.get_setting_window()
+    settings.camera_id = 51
+    settings.save_config()
+    assert saved() == ("51", "48, 50"), saved()
+    print(f"settings: saved camera_id and overlay_cameras {saved()}")
+
+    for widget in (*window.overlays, window):
+        widget.close()
+
+
+def benchmark_devices(probe_ms=150, lookups=10):
+    # A fake enumeration as slow as probing a few V4L2 nodes, and a temporary
+    # folder standing in for /dev to simulate hot-plug.
+    import tempfile
+
+    from services.device_registry import DeviceRegistry
+
+    folder = Path(tempfile.mkdtemp())
+
+    class FakeCameraInfo:
+        def __init__(self, path):
+            self.path = path
+
+        def deviceName(self):
+            return str(self.path)
+
+        def description(self):
+            return f"Camera {self.path.name}"
+
+    def enumerate_cameras():
+        time.sleep(probe_ms / 1000)
+        return [FakeCameraInfo(path) for path in sorted(folder.glob("video*"))]
+
+    (folder / "video0").touch()
+    report("devices: enumerate per lookup", *measure(enumerate_cameras, lookups))
+
+    registry = DeviceRegistry(enumerate_cameras, str(folder), settle_delay=100)
+    registry.devices
+    report("devices: registry lookup", *measure(lambda: registry.devices, lookups))
+
+    changes = []
+    registry.on_changed.add(changes.append)
+
+    (folder / "video1").touch()
+    assert wait_for(lambda: changes)
+    (folder / "unrelated").touch()
+    wait_for(lambda: False, 0.5)
+    (folder / "video0").unlink()
+    assert wait_for(lambda: len(changes) == 2), changes
+
+    print(
+        f"devices: hot-plug changes {[[d.id[-6:] for d in c] for c in changes]}, "
+        f"{registry.enumerations} enumerations in total"
+    )
+
+    # Without a folder to watch, polls enumerate only when the signature moves.
+    signature = [("camera0",)]
+    polled = DeviceRegistry(
+        enumerate_cameras, str(folder / "missing"), poll_interval=50
+    )
+    polled.device_signature = lambda: signature[0]
+    polled.devices
+    wait_for(lambda: False, 0.5)
+    assert polled.stats()["hot_plug"] == "polling"
+    assert polled.enumerations == 1, polled.enumerations
+    signature[0] = ("camera0", "camera1")
+    assert wait_for(lambda: polled.enumerations == 2), polled.enumerations
+    polled.poll_timer.stop()
+    print(f"devices: polling, {polled.enumerations} enumerations over 1 change")
+
+    # A saved camera that is gone falls back to the first one on the main
+    # window, the overlays skip it.
+    import main
+
+    config = main.Config()
+    frame_source, config.frame_source = config.frame_source, main.CAMERA_FRAME_SOURCE
+    device_registry, main.device_registry = main.device_registry, registry
+    try:
+        plugged = registry.id_at(0)
+        for saved in (str(folder / "video0"), "3"):
+            assert main.resolve_camera_id(saved, fallback=True) == plugged, saved
+            try:
+                main.resolve_camera_id(saved)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"{saved} resolved without a fallback")
+        assert main.resolve_camera_id("0") == plugged
+        assert main.resolve_camera_id(plugged) == plugged
+    finally:
+        config.frame_source = frame_source
+        main.device_registry = device_registry
+
+
+EXPORT_READER = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+from services.shm_ring import RingReader
+
+reader = RingReader(sys.argv[2])
+deadline = time.monotonic() + float(sys.argv[3])
+last = seen = bad = 0
+while time.monotonic() < deadline:
+    frame = reader.latest()
+    if frame is None or frame.sequence == last:
+        continue
+    value = frame.sequence % 251
+    pixels = frame.pixels
+    if frame.sequence < last or pixels.min() != value or pixels.max() != value:
+        bad += 1
+    last = frame.sequence
+    seen += 1
+print(json.dumps({**reader.stats(), "seen": seen, "bad": bad}))
+"""
+
+
+def benchmark_export(frames=2000, reader_seconds=2.0):
+    # Circle frames into a shared-memory ring: write throughput, then an
+    # in-process and a separate reader process checking that no frame they
+    # accept was torn by the writer.
+    import json
+    import subprocess
+
+    from PyQt5.QtGui import QPainter
+
+    from services.frame_export import FrameExport
+    from services.numpy_frames import image_to_array
+    from services.shm_ring import RingReader, RingWriter
+
+    name = f"kolo-face-benchmark-{os.getpid()}"
+
+    for side in (300, 600):
+        circle = QImage(side, side, QImage.Format_ARGB32_Premultiplied)
+        circle.fill(Qt.transparent)
+        painter = QPainter(circle)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setBrush(QColor(200, 120, 90))
+        painter.drawEllipse(0, 0, side, side)
+        painter.end()
+
+        export = FrameExport(name)
+        fps, latency = measure(lambda: export.write(circle), frames)
+        report(f"export: {side}x{side} circle", fps, latency)
+        megabytes = side * side * 4 * fps / 1e6
+        print(f"export: {side}x{side} {megabytes:.0f} MB/s into the ring")
+
+        reader = RingReader(name)
+        frame = reader.latest()
+        rgba = circle.convertToFormat(QImage.Format_RGBA8888)
+        assert (frame.pixels == image_to_array(rgba)).all()
+        reader.close()
+        export.close()
+
+    side, slots = 300, 2
+    writer = RingWriter(name, side, side, slots)
+    reader = RingReader(name)
+
+    def write():
+        sequence = writer.sequence + 1
+        writer.begin()[:side, :side] = sequence % 251
+        writer.commit(side, side)
+
+    intact = 0
+    for _ in range(frames):
+        write()
+        view = reader.latest(copy=False)
+        assert (view.pixels == view.sequence % 251).all()
+        write()
+        intact += reader.is_intact(view)
+    # With two slots the view survives one more frame, not a second one.
+    assert intact == frames
+    write()
+    assert not reader.is_intact(view)
+    print(f"export: in-process reader, {frames} zero-copy frames intact")
+    view = None
+    reader.close()
+
+    # The writer runs flat out on two slots, the worst case for tearing.
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            EXPORT_READER,
+            str(src_folder),
+            name,
+            str(reader_seconds),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    written, start = writer.written, time.perf_counter()
+    while process.poll() is None:
+        write()
+    elapsed = time.perf_counter() - start
+    written = writer.written - written
+    result = json.loads(process.stdout.read())
+    writer.close()
+
+    assert result["bad"] == 0, result
+    print(
+        f"export: other process: {written / elapsed:.0f} frames/s written, "
+        f"{result['seen']} read, {result['retried']} overwritten while read "
+        f"and retried, {result['bad']} torn"
+    )
+
+
+STARTUP_PROBE = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv[:1])
+import benchmark
+benchmark.measure_startup()
+"""
+
+
+def measure_startup():
+    # Runs in the fresh interpreter started by benchmark_startup, where main
+    # is imported for the first time.
+    import json
+    import tempfile
+
+    start = time.perf_counter()
+    import main
+
+    imported = time.perf_counter()
+
+    config_file = Path(tempfile.mkdtemp()) / "config.ini"
+    config_file.write_text(
+        "[DEFAULT]\ncamera_id = 0\nsize = 300\nframe_source = synthetic\n"
+    )
+    main.Config().config_file = config_file
+    main.app = app = QApplication.instance()
+    main.instrumentation.enable()
+
+    window = main.MainWindow()
+    window.show()
+    created = time.perf_counter()
+
+    wait_for_display(app, main.instrumentation, 0)
+    displayed = time.perf_counter()
+
+    window.show_settings()
+    settings = time.perf_counter()
+    window.close()
+
+    milliseconds = {
+        "import": imported - start,
+        "window": created - imported,
+        "first_frame": displayed - created,
+        "launch_to_first_frame": displayed - start,
+        "settings": settings - displayed,
+    }
+    print(json.dumps({key: value * 1000 for key, value in milliseconds.items()}))
+
+
+def benchmark_startup(budget_ms=500):
+    # Launch to first frame in the circle with the synthetic camera.
+    import json
+    import subprocess
+
+    process = subprocess.run(
+        [sys.executable, "-c", STARTUP_PROBE, str(Path(__file__).resolve().parent)],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(process.stdout.splitlines()[-1])
+    print(
+        f"startup: import {timings['import']:.0f} ms, "
+        f"window {timings['window']:.0f} ms, "
+        f"first frame {timings['first_frame']:.0f} ms, "
+        f"launch to first frame {timings['launch_to_first_frame']:.0f} ms, "
+        f"opening settings {timings['settings']:.0f} ms"
+    )
+    assert timings["launch_to_first_frame"] <= budget_ms, timings
+
+
+BENCHMARKS = {
+    "mask": benchmark_mask,
+    "quality": benchmark_quality,
+    "burst": benchmark_burst,
+    "yuv": benchmark_yuv,
+    "sources": benchmark_sources,
+    "viewfinder": benchmark_viewfinder,
+    "pipeline": benchmark_pipeline,
+    "display": benchmark_display,
+    "pool": benchmark_pool,
+    "metrics": benchmark_metrics,
+    "crop": benchmark_crop,
+    "editor": benchmark_editor,
+    "preview": benchmark_preview,
+    "tracking": benchmark_tracking,
+    "motion": benchmark_motion,
+    "cameras": benchmark_cameras,
+    "leases": benchmark_leases,
+    "switching": benchmark_switching,
+    "settings": benchmark_settings,
+    "devices": benchmark_devices,
+    "export": benchmark_export,
+    "startup": benchmark_startup,
+}
+
+
+app = None
+
+
+def main(names=None):
+    # Benchmarks look the application up with instance(). It only lives as
+    # long as a reference to it does.
+    global app
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    names = names or sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
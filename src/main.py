@@ -1,31 +1,69 @@
+import argparse
+import json
 import sys
-import typing
+import time
 import numpy as np
 
-from PyQt5 import QtCore, QtMultimedia, QtGui, QtWidgets
-from PyQt5.Qt import (
-    Qt,
-    QImage,
-    QPainter,
-    QBrush,
-    QRect,
-    QWindow,
-    QPixmap,
-    QPointF,
-    QRectF,
-    QSize,
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5.QtCore import Qt, QPointF, QRectF, QSize
+from PyQt5.QtGui import QCursor, QColor, QPen, QBrush, QPainter, QPixmap, QTransform
+from PyQt5.QtMultimedia import QCamera, QVideoFrame
+from PyQt5.QtWidgets import (
+    QApplication,
+    QGraphicsItem,
+    QGraphicsPixmapItem,
+    QGraphicsScene,
+    QGraphicsSceneHoverEvent,
+    QGraphicsView,
+    QLabel,
+    QMainWindow,
+    QMenu,
+    QMessageBox,
+    QSystemTrayIcon,
+    QVBoxLayout,
+    QWidget,
 )
-from PyQt5.QtGui import QCursor, QColor, QPen
-from PyQt5.QtMultimedia import *
-from PyQt5.QtMultimediaWidgets import *
-from PyQt5.QtWidgets import *
-from PyQt5.QtWidgets import QGraphicsItem, QGraphicsSceneHoverEvent, QWidget
 import configparser
 
 import config
 from services.singleton import SingletonMeta
 from services.callbacks import Callbacks
-import ui.settings_control_panel as settings_control_panel_ui
+from services.mask_engine import MaskEngine, SCALE_THEN_MASK, QPAINTER_BACKEND
+from services.frame_worker import FrameWorker
+from services.image_pool import ImagePool
+from services.display_metrics import DisplayMetrics
+from services.crop_rect import (
+    CropRectPublisher,
+    centered_square,
+    crop_change_rects,
+    map_crop,
+    scale_rect,
+)
+from services.device_registry import DeviceRegistry
+from services.camera_sessions import SessionCache
+from services.capture_lifecycle import CaptureLifecycle
+from services.frame_export import FrameExport
+from services.face_tracker import FaceTracker, thumbnail_step
+from services.motion_detector import MotionDetector, MOTION_THUMBNAIL_WIDTH
+from services.frame_scheduler import FrameScheduler, ReentrancyGuard
+from services.decoded_frame import DecodedFrame, DecodeStats
+from services.source_entry import SourceEntry
+from services.instrumentation import Instrumentation
+from services.frame_sources import (
+    CameraFrameSource,
+    ReplayFrameSource,
+    SyntheticFrameSource,
+    CAMERA_FRAME_SOURCE,
+    SYNTHETIC_FRAME_SOURCE,
+    REPLAY_FRAME_SOURCE,
+    PIXEL_FORMATS,
+)
+from services.viewfinder import (
+    ViewfinderMode,
+    parse_resolution,
+    required_frame_side,
+    select_viewfinder_mode,
+)
 
 
 def vector_projection(base_vector, projecting_vector):
@@ -37,62 +75,26 @@ def vector_projection(base_vector, projecting_vector):
     return projection
 
 
-def mask_image(image, size, rect):
-    # Load image
-    # image = QImage.fromData(imgdata, imgtype)
-
-    # convert image to 32-bit ARGB (adds an alpha
-    # channel ie transparency factor):
-    # image.convertToFormat(QImage.Format_ARGB32)
-
-    # # Crop image to a square:
-    # imgsize = min(image.width(), image.height())
-    # rect = QRect(
-    #     (image.width() - imgsize) // 2,
-    #     (image.height() - imgsize) // 2,
-    #     imgsize,
-    #     imgsize,
-    # )
-    rect = QRect(
-        int(rect.x()),
-        int(rect.y()),
-        int(rect.width()),
-        int(rect.height()),
-    )
-
-    image = image.copy(rect)
-
-    # Create the output image with the same dimensions
-    # and an alpha channel and make it completely transparent:
-    out_img = QImage(rect.width(), rect.height(), QImage.Format_ARGB32)
-    out_img.fill(Qt.transparent)
+image_pool = ImagePool()
+mask_engine = MaskEngine(pool=image_pool)
+display_metrics = DisplayMetrics()
+device_registry = DeviceRegistry()
+instrumentation = Instrumentation()
 
-    # Create a texture brush and paint a circle
-    # with the original image onto the output image:
-    brush = QBrush(image)
+LABEL_DISPLAY = "label"
+PAINTER_DISPLAY = "painter"
 
-    # Paint the output image
-    painter = QPainter(out_img)
-    painter.setBrush(brush)
+DEFAULT_PREVIEW_SIZE = (640, 480)
 
-    # Don't draw an outline
-    painter.setPen(Qt.NoPen)
+# The viewfinder is renegotiated once the crop stops changing, not for
+# every step of a drag: a resolution switch restarts the camera.
+VIEWFINDER_SETTLE_MS = 500
 
-    # drawing circle
-    painter.drawEllipse(0, 0, rect.width(), rect.height())
 
-    # closing painter event
-    painter.end()
-
-    # Convert the image to a pixmap and rescale it.
-    pr = QWindow().devicePixelRatio()
-    pm = QPixmap.fromImage(out_img)
-    pm.setDevicePixelRatio(pr)
-    size = int(size * pr)
-    pm = pm.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-
-    # return back the pixmap data
-    return pm
+def mask_image(frame, size, rect, device_pixel_ratio=1.0):
+    with instrumentation.measure("mask_image"):
+        image, rect = frame.crop(rect)
+        return mask_engine.mask(image, size, rect, device_pixel_ratio)
 
 
 # class Config(metaclass=SingletonMeta):
@@ -139,7 +141,27 @@ class Config(metaclass=SingletonMeta):
     def __init__(self, config_file=config.CONFIG_FILE):
         self.config_file = config_file
         self.camera_id = 0
+        self.camera_device = ""
         self.size = 300
+        self.pipeline_mode = SCALE_THEN_MASK
+        self.mask_backend = QPAINTER_BACKEND
+        self.preview_fps = 15
+        self.capture_fps = 30
+        self.capture_resolution = ""
+        self.frame_source = CAMERA_FRAME_SOURCE
+        self.replay_path = ""
+        self.synthetic_pattern = "moving"
+        self.synthetic_pixel_format = "rgb32"
+        self.display_mode = LABEL_DISPLAY
+        self.auto_crop = False
+        self.face_detect_every = 10
+        self.motion_threshold = 6.0
+        self.min_refresh_interval = 0.5
+        self.overlay_cameras = ""
+        self.capture_linger = 2000
+        self.warm_cameras = 2
+        self.export_frames = ""
+        self.export_slots = 4
 
         self.config = configparser.ConfigParser()
         self.put_data_to_config(self.size, self.camera_id)
@@ -147,10 +169,31 @@ class Config(metaclass=SingletonMeta):
     def put_data_to_config(self, size, camera_id):
         self.config["DEFAULT"] = {
             "camera_id": camera_id,
+            "camera_device": self.camera_device,
             "size": size,
+            "pipeline_mode": self.pipeline_mode,
+            "mask_backend": self.mask_backend,
+            "preview_fps": self.preview_fps,
+            "capture_fps": self.capture_fps,
+            "capture_resolution": self.capture_resolution,
+            "frame_source": self.frame_source,
+            "replay_path": self.replay_path,
+            "synthetic_pattern": self.synthetic_pattern,
+            "synthetic_pixel_format": self.synthetic_pixel_format,
+            "display_mode": self.display_mode,
+            "auto_crop": self.auto_crop,
+            "face_detect_every": self.face_detect_every,
+            "motion_threshold": self.motion_threshold,
+            "min_refresh_interval": self.min_refresh_interval,
+            "overlay_cameras": self.overlay_cameras,
+            "capture_linger": self.capture_linger,
+            "warm_cameras": self.warm_cameras,
+            "export_frames": self.export_frames,
+            "export_slots": self.export_slots,
         }
 
     def upload(self, size, camera_id):
+        self.size, self.camera_id = size, camera_id
         self.put_data_to_config(size, camera_id)
 
         with self.config_file.open("w") as configfile:
@@ -160,12 +203,105 @@ class Config(metaclass=SingletonMeta):
         # try:
         self.config.read(self.config_file)
         self.camera_id = int(self.config["DEFAULT"]["camera_id"])
+        self.camera_device = self.config["DEFAULT"].get(
+            "camera_device", self.camera_device
+        )
         self.size = int(self.config["DEFAULT"]["size"])
+        self.pipeline_mode = self.config["DEFAULT"].get(
+            "pipeline_mode", self.pipeline_mode
+        )
+        self.mask_backend = self.config["DEFAULT"].get(
+            "mask_backend", self.mask_backend
+        )
+        self.preview_fps = self.config["DEFAULT"].getint(
+            "preview_fps", self.preview_fps
+        )
+        self.capture_fps = self.config["DEFAULT"].getint(
+            "capture_fps", self.capture_fps
+        )
+        self.capture_resolution = self.config["DEFAULT"].get(
+            "capture_resolution", self.capture_resolution
+        )
+        self.frame_source = self.config["DEFAULT"].get(
+            "frame_source", self.frame_source
+        )
+        self.replay_path = self.config["DEFAULT"].get("replay_path", self.replay_path)
+        self.synthetic_pattern = self.config["DEFAULT"].get(
+            "synthetic_pattern", self.synthetic_pattern
+        )
+        self.synthetic_pixel_format = self.config["DEFAULT"].get(
+            "synthetic_pixel_format", self.synthetic_pixel_format
+        )
+        self.display_mode = self.config["DEFAULT"].get(
+            "display_mode", self.display_mode
+        )
+        self.auto_crop = self.config["DEFAULT"].getboolean("auto_crop", self.auto_crop)
+        self.face_detect_every = self.config["DEFAULT"].getint(
+            "face_detect_every", self.face_detect_every
+        )
+        self.motion_threshold = self.config["DEFAULT"].getfloat(
+            "motion_threshold", self.motion_threshold
+        )
+        self.min_refresh_interval = self.config["DEFAULT"].getfloat(
+            "min_refresh_interval", self.min_refresh_interval
+        )
+        self.overlay_cameras = self.config["DEFAULT"].get(
+            "overlay_cameras", self.overlay_cameras
+        )
+        self.capture_linger = self.config["DEFAULT"].getint(
+            "capture_linger", self.capture_linger
+        )
+        self.warm_cameras = self.config["DEFAULT"].getint(
+            "warm_cameras", self.warm_cameras
+        )
+        self.export_frames = self.config["DEFAULT"].get(
+            "export_frames", self.export_frames
+        )
+        self.export_slots = self.config["DEFAULT"].getint(
+            "export_slots", self.export_slots
+        )
+
+    def get_overlay_camera_ids(self):
+        # Device ids or indices of extra circles next to the main one.
+        return [
+            part.strip() for part in self.overlay_cameras.split(",") if part.strip()
+        ]
+
+    def set_overlay_camera_id(self, index, camera_id):
+        camera_ids = self.get_overlay_camera_ids()
+        camera_ids[index] = str(camera_id)
+        self.overlay_cameras = ", ".join(camera_ids)
+
+
+def resolve_camera_id(camera_id, fallback=False):
+    # Real cameras are keyed by their stable device id, indices (as in older
+    # configs) are looked up in the registry. Other sources keep indices.
+    if Config().frame_source != CAMERA_FRAME_SOURCE:
+        return int(camera_id)
+    if isinstance(camera_id, int) or camera_id.isdigit():
+        device_id = device_registry.id_at(int(camera_id))
+    elif device_registry.find(camera_id) is not None:
+        device_id = camera_id
+    else:
+        device_id = None
+
+    if device_id is not None or not device_registry.devices:
+        return device_id or camera_id
+    if not fallback:
+        raise ValueError(f"Camera {camera_id} not found")
+
+    # The saved camera was unplugged, start with another one meanwhile.
+    device_id = device_registry.id_at(0)
+    print(f"Camera {camera_id} not found, using {device_id}")
+    return device_id
 
 
 class SettingsPanelWidget(QWidget):
     def __init__(self, parent):
         super().__init__(parent)
+        # Only needed once the settings are opened, not on startup.
+        import ui.settings_control_panel as settings_control_panel_ui
+
         self.ui = settings_control_panel_ui.Ui_Form()
         self.ui.setupUi(self)
 
@@ -175,8 +311,20 @@ class CameraPixmapItem(QGraphicsPixmapItem):
         ...
 
 
+class CameraPreviewView(QGraphicsView):
+    resized = QtCore.pyqtSignal()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()
+
+
 class CameraResizeWidget(QGraphicsItem):
-    ...
+    def boundingRect(self):
+        return QRectF()
+
+    def paint(self, painter, option, widget):
+        pass
 
 
 class QGraphicsItemPositionMixin(object):
@@ -293,16 +441,25 @@ class CameraResizeMarkerWidget(QGraphicsItem, QGraphicsItemPositionMixin):
 class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
     MARKER_DISTANCE = 100
 
-    def __init__(self, border_rect: QRectF) -> None:
+    def __init__(
+        self, border_rect: QRectF, crop_rect=None, frame_rect=None, initial_rect=None
+    ) -> None:
         super().__init__()
         self.setAcceptHoverEvents(True)
 
+        # The editor works on a reduced preview; frame_rect is the frame in
+        # sensor pixels, which the published crop is mapped back to.
+        self.crop_rect = crop_rect or CropRectPublisher()
         self.border_rect: QRectF = border_rect
-        size = min(self.border_rect.width(), self.border_rect.height())
-        dx = self.border_rect.x() + (self.border_rect.width() - size) // 2
-        dy = self.border_rect.y() + (self.border_rect.height() - size) // 2
+        self.frame_rect = frame_rect or border_rect
+        self.frame_scale = self.frame_rect.width() / self.border_rect.width()
+        if initial_rect is None:
+            square = centered_square(self.border_rect)
+        else:
+            square = initial_rect
+        dx, dy = square.x(), square.y()
 
-        self.size = (size, size)
+        self.size = (square.width(), square.height())
 
         marker_size = CameraResizeMarkerWidget.MARKER_SIZE
         self.marker_0 = CameraResizeMarkerWidget(
@@ -338,10 +495,43 @@ class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
         self._dx = 0
         self._dy = 0
 
+        self.painted_crop_rect = self.get_painted_rect()
+
+        if initial_rect is None:
+            # Published in frame pixels, so rounding in the preview does not
+            # shift the default crop.
+            self.crop_rect.publish(centered_square(self.frame_rect), self.frame_rect)
+
+    def publish_rect(self):
+        # The frame pipeline reads this snapshot instead of the scene items.
+        rect = scale_rect(self.get_crop_rect(), self.frame_scale)
+        self.crop_rect.publish(rect.intersected(self.frame_rect), self.frame_rect)
+
+    def update_crop_region(self):
+        # Item updates are merged into one bounding rect, so the changed
+        # strips go to the views directly instead of the whole crop.
+        rect = self.get_painted_rect()
+        if rect == self.painted_crop_rect:
+            return
+
+        margin = self.border_pen.width() + 1
+        dirty = crop_change_rects(self.painted_crop_rect, rect, margin)
+        self.painted_crop_rect = rect
+
+        scene = self.scene()
+        if scene is None:
+            return
+        dirty = [self.mapRectToScene(strip) for strip in dirty]
+        for view in scene.views():
+            view.updateScene(dirty)
+
     def is_marker_can_move(self) -> bool:
-        rect = self.boundingRect()
+        rect = self.get_crop_rect()
+        # The minimum crop is in frame pixels, the markers move in the preview.
+        frame_crop = scale_rect(rect, self.frame_scale)
         is_rect_not_to_small = (
-            rect.width() > self.MARKER_DISTANCE and rect.height() > self.MARKER_DISTANCE
+            frame_crop.width() > self.MARKER_DISTANCE
+            and frame_crop.height() > self.MARKER_DISTANCE
         )
         is_rect_out_of_bounds = self.border_rect.intersected(rect) != rect
         return is_rect_not_to_small and not is_rect_out_of_bounds
@@ -391,10 +581,16 @@ class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
             case _:
                 ...
 
-        # self.scene().
-        QtGui.QGuiApplication.processEvents()
+        self.publish_rect()
+        self.update_crop_region()
 
     def boundingRect(self):
+        # The dimming covers the whole frame, the outline may stick out of it
+        # by its width.
+        width = self.border_pen.width()
+        return self.border_rect.adjusted(-width, -width, width, width)
+
+    def get_crop_rect(self):
         start_point = self.marker_0.position
         end_point = self.marker_2.position
 
@@ -406,8 +602,15 @@ class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
         )
         return QRectF(*start_point, *w_h)
 
+    def get_painted_rect(self):
+        # The crop snapped to whole pixels, as it is drawn.
+        rect = self.get_crop_rect()
+        return QRectF(
+            int(rect.x()), int(rect.y()), int(rect.width()), int(rect.height())
+        )
+
     def paint(self, painter, option, widget):
-        rect = self.boundingRect()
+        rect = self.get_painted_rect()
         w = int(rect.width())
         h = int(rect.height())
         x = int(rect.x())
@@ -425,14 +628,14 @@ class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
         painter.fillRect(x, y + h, w, b_h - (y + h - b_y), self.bg_color)
 
         painter.setPen(self.border_pen)
-        painter.drawRect(self.boundingRect())
-        painter.drawEllipse(self.boundingRect())
+        painter.drawRect(rect)
+        painter.drawEllipse(rect)
 
     def hoverEnterEvent(self, event):
         pass
 
     def hoverMoveEvent(self, event):
-        rect = self.boundingRect()
+        rect = self.get_crop_rect()
         x_c = rect.x() + rect.width() / 2
         y_c = rect.y() + rect.height() / 2
 
@@ -458,7 +661,7 @@ class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
         self.is_can_drag = False
 
     def move_markers(self, position):
-        rect = self.boundingRect()
+        rect = self.get_crop_rect()
 
         self.marker_0.position = (position[0], position[1])
         self.marker_1.position = (
@@ -480,7 +683,7 @@ class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
 
         new_pos = event.scenePos()
         x, y = new_pos.x(), new_pos.y()
-        old_rect = self.boundingRect()
+        old_rect = self.get_crop_rect()
 
         self.move_markers((x - self._dx, y - self._dy))
 
@@ -491,6 +694,9 @@ class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
 
             self.move_markers((old_x, old_y))
 
+        self.publish_rect()
+        self.update_crop_region()
+
     def mousePressEvent(self, event):
         pass
 
@@ -500,10 +706,17 @@ class CameraResizeRectWidget(QGraphicsItem, QGraphicsItemPositionMixin):
 
 class SettingsWindow(QWidget):
     size_changed = QtCore.pyqtSignal(int)
+    camera_changed = QtCore.pyqtSignal(object)
 
-    def __init__(self, default_size, default_camera_id):
+    def __init__(
+        self, default_size, default_camera_id, crop_rect=None, overlay_index=None
+    ):
         super().__init__()
         self.config = Config()
+        # Overlays save their camera into overlay_cameras, never as the main
+        # camera.
+        self.overlay_index = overlay_index
+        self.camera_id = default_camera_id
         self.settings_panel = SettingsPanelWidget(self)
         self.layout = QVBoxLayout(self)
 
@@ -516,15 +729,20 @@ class SettingsWindow(QWidget):
             camera_source_widget=self.camera_image,
             parent=self,
             add_to_layout=False,
+            fps=self.config.preview_fps,
         )
-        self.camera.camera.on_camera_size_changed.add(self.change_camera_resize_item)
+        # A frame reduced to the view is enough for editing the crop.
+        self.camera.set_process_pixmap(self.preview_frame)
+        self.camera.camera.on_camera_size_changed.add(self.fit_preview)
         # self.camera
 
         self.camera_resize_widget = CameraResizeWidget()
 
         self.scene = QGraphicsScene()
-        self.view = QGraphicsView()
+        self.view = CameraPreviewView()
         self.view.setScene(self.scene)
+        self.view.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
+        self.view.resized.connect(self.fit_preview)
 
         self.scene.addItem(self.camera_image)
         self.scene.addItem(self.camera_resize_widget)
@@ -532,6 +750,9 @@ class SettingsWindow(QWidget):
         self.camera_image.setFocus(True)
 
         self.camera_resize_item = None
+        self.crop_rect = crop_rect or CropRectPublisher()
+        # Built on first open, when the device is usually running already.
+        self.fit_preview()
 
         self.layout.addWidget(self.view)
         self.layout.addWidget(self.settings_panel)
@@ -539,28 +760,54 @@ class SettingsWindow(QWidget):
             self.change_camera
         )
         self.available_cameras = []
+        device_registry.on_changed.add(self.update_cameras_list)
 
         self.settings_panel.ui.size_input.setValue(default_size)
         self.settings_panel.ui.size_input.valueChanged.connect(self.change_size)
         self.settings_panel.ui.save_button.clicked.connect(self.save_config)
 
-        self.camera.start_camera()
+        width, height = DEFAULT_PREVIEW_SIZE
+        self.resize(width, height + self.settings_panel.sizeHint().height())
 
     def get_camera_resize_rect(self):
-        return self.camera_resize_item.boundingRect()
+        return self.crop_rect.snapshot.rect
 
     def change_size(self, size: int):
         self.size_changed.emit(size)
 
     def save_config(self):
+        if self.overlay_index is not None:
+            self.config.set_overlay_camera_id(self.overlay_index, self.camera_id)
+            self.config.upload(self.config.size, self.config.camera_id)
+            return
+
+        camera_id = self.camera_id
+        if isinstance(camera_id, str):
+            # The index is kept for older versions, the device id wins.
+            self.config.camera_device = camera_id
+            camera_id = max(device_registry.index_of(camera_id), 0)
+
         self.config.upload(
             size=self.settings_panel.ui.size_input.value(),
-            camera_id=self.camera_id,
+            camera_id=camera_id,
         )
 
-    def change_camera(self, camera_id):
+    def change_camera(self, index):
+        camera_id = self.settings_panel.ui.cameras_list.itemData(index)
+        if camera_id is None or camera_id == self.camera_id:
+            return
+
         self.camera_id = camera_id
+        camera = self.camera.camera
+        camera.on_camera_size_changed.remove(self.fit_preview)
         self.camera.change_camera_id(camera_id)
+
+        camera = self.camera.camera
+        camera.on_camera_size_changed.add(self.fit_preview)
+        if camera.frame_size.isValid():
+            # The device is already running for another window.
+            self.fit_preview(camera.frame_size)
+        self.camera_changed.emit(camera_id)
         # self.camera.resize_camera_source_widget()
 
         # size = self.camera.size()
@@ -568,25 +815,128 @@ class SettingsWindow(QWidget):
         # size = self.camera_image.pixmap().size()
         # print(size)
 
-    def change_camera_resize_item(self, size):
+    def preview_frame(self, frame, size):
+        # Runs on the frame worker.
+        return frame.preview(*size)
+
+    def fit_preview(self, frame_size=None):
+        if frame_size is None:
+            frame_size = self.camera.camera.frame_size
+        if not frame_size.isValid():
+            return
+
+        viewport = self.view.viewport().size()
+        frame_width, frame_height = frame_size.width(), frame_size.height()
+        scale = min(
+            viewport.width() / frame_width, viewport.height() / frame_height, 1.0
+        )
+        size = (max(1, int(frame_width * scale)), max(1, int(frame_height * scale)))
+        frame_rect = QRectF(0, 0, frame_width, frame_height)
+        item = self.camera_resize_item
+        if item is not None and item.frame_rect == frame_rect:
+            if size == self.camera.size:
+                return
+
+        border_rect = QRectF(0, 0, *size)
+        # The crop is kept, moved to a new frame size and mapped to the new
+        # preview.
+        initial_rect = None
+        snapshot = self.crop_rect.snapshot
+        if not snapshot.is_empty():
+            rect = map_crop(snapshot, frame_rect)
+            self.crop_rect.publish(rect, frame_rect)
+            rect = scale_rect(rect, size[0] / frame_width)
+            rect = rect.intersected(border_rect)
+            side = min(rect.width(), rect.height())
+            initial_rect = QRectF(rect.x(), rect.y(), side, side)
+
+        self.camera.size = size
+        self.camera.resize_camera_source_widget()
+        self.scene.setSceneRect(border_rect)
+
         if self.camera_resize_item is not None:
             self.scene.removeItem(self.camera_resize_item)
 
         self.camera_resize_item = CameraResizeRectWidget(
-            border_rect=QRectF(0, 0, size.width(), size.height())
-            # border_rect=QRectF(QPointF(0, 0), size)
+            border_rect=border_rect,
+            crop_rect=self.crop_rect,
+            frame_rect=frame_rect,
+            initial_rect=initial_rect,
         )
         self.scene.addItem(self.camera_resize_item)
 
-    def update_cameras_list(self):
+    def update_cameras_list(self, *args):
         self.available_cameras = self.camera.get_available_cameras()
-        cameras_names = list(map(lambda x: x.description(), self.available_cameras))
-        self.settings_panel.ui.cameras_list.addItems(cameras_names)
+
+        cameras_list = self.settings_panel.ui.cameras_list
+        cameras_list.blockSignals(True)
+        cameras_list.clear()
+        for device in self.available_cameras:
+            cameras_list.addItem(device.description, device.id)
+        cameras_list.setCurrentIndex(cameras_list.findData(self.camera_id))
+        cameras_list.blockSignals(False)
 
     def showEvent(self, a0) -> None:
         self.update_cameras_list()
+        self.camera.start_camera()
         return super().showEvent(a0)
 
+    def hideEvent(self, a0) -> None:
+        self.camera.stop_camera()
+        return super().hideEvent(a0)
+
+
+class CircleFrameWidget(QWidget):
+    # Draws the latest frame straight into the widget: the crop and scale
+    # happen in the texture transform and the circle is the painted shape,
+    # so no mask and no per-frame pixmap are needed.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.image = None
+        self.source_rect = QRectF()
+        self.crop_version = None
+        self.transform = QTransform()
+        self._transform_key = None
+        self.setAttribute(Qt.WA_TranslucentBackground)
+
+    def set_frame(self, frame):
+        # The crop version is None for crops that move every frame.
+        self.image, source_rect, self.crop_version = frame
+        self.source_rect = QRectF(source_rect)
+        self.update()
+
+    def paintEvent(self, event):
+        if self.image is None or self.source_rect.isEmpty():
+            return
+
+        side = min(self.width(), self.height())
+        if self.crop_version is None:
+            transform_key = (self.source_rect.getRect(), side)
+        else:
+            # Within one crop version the rect only differs between a native
+            # crop and the whole frame, which differ in size.
+            image_size = (self.image.width(), self.image.height())
+            transform_key = (self.crop_version, image_size, side)
+        if transform_key != self._transform_key:
+            # Only rebuilt when the crop or the widget size changes.
+            rect = self.source_rect
+            scale = side / max(rect.width(), rect.height())
+            self.transform = QTransform()
+            self.transform.scale(scale, scale)
+            self.transform.translate(-rect.x(), -rect.y())
+            self._transform_key = transform_key
+
+        brush = QBrush(self.image)
+        brush.setTransform(self.transform)
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(brush)
+        painter.drawEllipse(QRectF(0, 0, side, side))
+        painter.end()
+
 
 class SystemTrayIcon(QSystemTrayIcon):
     def __init__(self, icon, parent=None):
@@ -594,80 +944,370 @@ class SystemTrayIcon(QSystemTrayIcon):
         menu = QMenu()
         self.settingsAction = menu.addAction("Settings")
         self.showOrHideAction = menu.addAction("Show/Hide")
+        self.statisticsAction = menu.addAction("Collect statistics")
+        self.statisticsAction.setCheckable(True)
+        self.showStatisticsAction = menu.addAction("Show statistics")
         self.exitAction = menu.addAction("Exit")
         self.setContextMenu(menu)
 
 
-class Camera(metaclass=SingletonMeta):
+class Camera:
+    # One capture manager per device, shared by every window showing it.
+    # Each device has its own worker thread, so a slow one can't stall the
+    # others. Devices no window shows any more are kept warm for a quick
+    # switch back, see SessionCache.
+    sessions = None
+
+    @classmethod
+    def get(cls, camera_id=0):
+        if cls.sessions is None:
+            cls.sessions = SessionCache(cls, cls.close, Config().warm_cameras)
+        return cls.sessions.get(camera_id)
+
+    @classmethod
+    def get_all_stats(cls):
+        if cls.sessions is None:
+            return {}
+        return {camera_id: camera.get_stats() for camera_id, camera in cls.sessions}
+
     def __init__(self, camera_id=0):
+        self.camera_id = camera_id
         self.sources = {}
+        self.config = Config()
 
-        self.viewfinder = QCameraViewfinder()
-        self.probe = None
+        self.viewfinder = None
+        self.frame_source = None
+        self.camera = None
+        self.viewfinder_mode = None
+        self._viewfinder_request = None
 
         self._frame_size = QSize()
         self.on_camera_size_changed = Callbacks()
+        self.on_camera_size_changed.add(self.reset_buffers)
+
+        self.scheduler = FrameScheduler()
+        self.frame_guard = ReentrancyGuard()
+        self.decode_stats = DecodeStats()
+        self.motion_detector = MotionDetector(
+            self.config.motion_threshold, self.config.min_refresh_interval
+        )
+
+        if self.config.frame_source == CAMERA_FRAME_SOURCE:
+            if not device_registry.devices:
+                print("No camera found.")
+                sys.exit()
+
+        self.lifecycle = CaptureLifecycle(
+            self.start_device, self.stop_device, self.config.capture_linger
+        )
+
+        # Unknown devices raise here, before the worker thread exists.
+        self.__init_camera()
 
-        self.change_camera_id(camera_id)
+        self.worker = FrameWorker(self.process_sources)
+        self.worker.frame_processed.connect(self.show_image, Qt.QueuedConnection)
+        self.worker.start()
+        QApplication.instance().aboutToQuit.connect(self.worker.stop)
+
+    @property
+    def frame_size(self):
+        return self._frame_size
 
     def get_size_or_camera_size(self):
-        size = self.viewfinder.size()
+        size = self._frame_size
+        if not size.isValid():
+            return DEFAULT_PREVIEW_SIZE
         return (size.width(), size.height())
 
     def __init_camera(self):
-        self.camera = QCamera(self.available_cameras[self.camera_id])
-        self.camera.setCaptureMode(QCamera.CaptureViewfinder)
-        self.camera.setViewfinder(self.viewfinder)
+        self.set_frame_source(self.create_frame_source())
+
+    def create_frame_source(self):
+        fps = self.config.capture_fps
+        if self.config.frame_source == SYNTHETIC_FRAME_SOURCE:
+            resolution = parse_resolution(self.config.capture_resolution)
+            return SyntheticFrameSource(
+                *(resolution or (1280, 720)),
+                fps=fps,
+                pixel_format=PIXEL_FORMATS[self.config.synthetic_pixel_format],
+                pattern=self.config.synthetic_pattern,
+                seed=self.camera_id,
+            )
+
+        if self.config.frame_source == REPLAY_FRAME_SOURCE:
+            return ReplayFrameSource(self.config.replay_path, fps=fps)
+
+        device = device_registry.find(self.camera_id)
+        if device is None:
+            raise ValueError(f"Camera {self.camera_id} not found")
+
+        if self.viewfinder is None:
+            # Only real cameras need it, and it pulls in QtMultimediaWidgets.
+            from PyQt5.QtMultimediaWidgets import QCameraViewfinder
+
+            self.viewfinder = QCameraViewfinder()
+
+        frame_source = CameraFrameSource(device.info, self.viewfinder)
+        frame_source.camera.statusChanged.connect(self.on_camera_status_changed)
+        return frame_source
+
+    def set_frame_source(self, frame_source):
+        if self.frame_source is not None:
+            self.frame_source.frame_ready.disconnect(self.process_frame)
+            self.frame_source.close()
+
+        self.frame_source = frame_source
+        self.camera = getattr(frame_source, "camera", None)
+        self.viewfinder_mode = None
+        self.frame_source.frame_ready.connect(self.process_frame)
+        if self.lifecycle.running:
+            self.frame_source.start()
+
+    def on_camera_status_changed(self, status):
+        # Supported settings are only known once the camera is loaded.
+        if status == QCamera.LoadedStatus:
+            self.apply_viewfinder_settings()
+
+    def get_viewfinder_modes(self):
+        modes = {}
+        for settings in self.camera.supportedViewfinderSettings():
+            resolution = settings.resolution()
+            mode = ViewfinderMode(
+                resolution.width(),
+                resolution.height(),
+                settings.minimumFrameRate(),
+                settings.maximumFrameRate(),
+                settings.pixelFormat(),
+            )
+            modes[mode] = settings
+        return modes
+
+    def negotiate_viewfinder(self, output_size, crop_fraction=1.0, dpr=1.0):
+        self._viewfinder_request = (output_size, crop_fraction, dpr)
+        self.apply_viewfinder_settings()
+
+    def apply_viewfinder_settings(self):
+        if self._viewfinder_request is None or self.camera is None:
+            return
+
+        modes = self.get_viewfinder_modes()
+        output_size, crop_fraction, dpr = self._viewfinder_request
+        mode = select_viewfinder_mode(
+            modes,
+            required_frame_side(output_size, crop_fraction, dpr),
+            self.config.capture_fps,
+            parse_resolution(self.config.capture_resolution),
+        )
+        if mode is None or mode == self.viewfinder_mode:
+            return
+
+        self.viewfinder_mode = mode
+        is_active = self.camera.state() == QCamera.ActiveState
+        if is_active:
+            self.camera.stop()
+
+        self.camera.setViewfinderSettings(modes[mode])
+
+        if is_active:
+            self.camera.start()
+
+    def add_source(self, source, func=None, size=None, fps=None, display=None):
+        self.motion_detector.reset()
+        entry = self.sources.get(source)
+        if entry is None:
+            self.sources[source] = SourceEntry(
+                func or self.process_pixmap, size, fps, display
+            )
+            return
+
+        entry.process = func or self.process_pixmap
+        entry.size = size
+        entry.display = display
+        if entry.fps != fps:
+            entry.fps = fps
+
+    def remove_source(self, source):
+        self.sources.pop(source, None)
+        self.scheduler.cancel(source)
+        self.motion_detector.reset(source)
+        self.park_if_unused()
+
+    def is_source_visible(self, source):
+        if isinstance(source, QGraphicsItem):
+            scene = source.scene()
+            return (
+                source.isVisible()
+                and scene is not None
+                and any(view.isVisible() for view in scene.views())
+            )
 
-        self.probe = QtMultimedia.QVideoProbe(self.camera)
-        self.probe.videoFrameProbed.connect(self.process_frame)
-        self.probe.setSource(self.camera)
+        return source.isVisible()
 
-    def add_source(self, source, func=None, size=None):
-        self.sources[source] = [func or self.process_pixmap, size]
+    def get_sources_stats(self):
+        return {source: entry.stats() for source, entry in self.sources.items()}
 
-    def process_pixmap(self, image, size):
-        pixmap = QPixmap.fromImage(image)
+    def reset_buffers(self, frame_size):
+        # Pooled buffers are sized by the windows, not by the frame, so they
+        # are kept for the other cameras.
+        self.motion_detector.reset()
+
+    def process_pixmap(self, frame, size):
+        image = frame.image
         if size is not None:
-            pixmap = pixmap.scaled(*size)
-        return pixmap
+            image = image.scaled(*size)
+        return image
+
+    def process_sources(self, frame, sources, captured_at):
+        # Runs on the worker thread, so only QImage work is allowed here.
+        with DecodedFrame(frame, self.decode_stats) as decoded:
+            luma = self.motion_thumbnail(decoded)
+            unchanged = 0
+            for source, entry in sources:
+                if not entry.deliver(self.has_frame_changed(luma, source)):
+                    unchanged += 1
+                    continue
+
+                with instrumentation.measure("process_sources"):
+                    size = entry.size
+                    if size is None:
+                        image = decoded.image
+                        size = (image.width(), image.height())
+
+                    image = entry.process(decoded, size)
+
+                yield source, image, captured_at
+
+            if unchanged == len(sources):
+                instrumentation.count("frames_unchanged")
+
+    def motion_thumbnail(self, decoded):
+        if not self.motion_detector.threshold:
+            return None
+
+        with instrumentation.measure("motion_detection"):
+            step = thumbnail_step(decoded.frame.width(), MOTION_THUMBNAIL_WIDTH)
+            return decoded.thumbnail(step)[0]
+
+    def has_frame_changed(self, luma, source):
+        # Every source is compared against the last frame it was given.
+        if luma is None:
+            return True
+
+        with instrumentation.measure("motion_detection"):
+            return self.motion_detector.has_changed(luma, key=source)
+
+    def show_image(self, source, image, captured_at):
+        self.scheduler.request(source, self.set_image, source, image, captured_at)
+
+    def set_image(self, source, image, captured_at):
+        entry = self.sources.get(source)
+        if entry is None:
+            return
 
-    def process_sources(self, frame):
-        for source, (process_pixmap, size) in self.sources.items():
-            if size is None:
-                size = frame.image().size()
-                size = (size.width(), size.height())
+        with instrumentation.measure("set_pixmap"):
+            if entry.display is not None:
+                entry.display(image)
+            else:
+                source.setPixmap(QPixmap.fromImage(image))
+                image_pool.release(image)
 
-            pixmap = process_pixmap(frame.image(), size)
-            source.setPixmap(pixmap)
+        instrumentation.record("capture_to_display", time.perf_counter() - captured_at)
+        instrumentation.count("frames_displayed")
+
+    def get_stats(self):
+        sources = {
+            f"{type(source).__name__}-{index}": entry.stats()
+            for index, (source, entry) in enumerate(list(self.sources.items()))
+        }
+        mailbox = self.worker.mailbox
+        return {
+            "frames_submitted": mailbox.posted,
+            "frames_dropped": mailbox.dropped,
+            "repaints_coalesced": self.scheduler.coalesced,
+            "reentrant_calls_avoided": self.frame_guard.avoided,
+            "decodes": self.decode_stats.decodes,
+            "decoded_frames": self.decode_stats.frames,
+            "native_crops": self.decode_stats.native_crops,
+            "image_pool": image_pool.stats(),
+            "motion": self.motion_detector.stats(),
+            "capture": self.lifecycle.stats(),
+            "display": display_metrics.stats(),
+            "sources": sources,
+        }
 
     def process_frame(self, frame):
-        QApplication.processEvents()
-        if frame.isValid():
-            frame_size = frame.size()
-            if self._frame_size != frame_size:
-                self.on_camera_size_changed.send(frame_size)
-                self._frame_size = frame_size
+        if not self.frame_guard.acquire():
+            return
 
-            self.process_sources(frame)
+        captured_at = time.perf_counter()
+        instrumentation.count("frames_probed")
+        try:
+            if frame.isValid():
+                frame_size = frame.size()
+                if self._frame_size != frame_size:
+                    self.on_camera_size_changed.send(frame_size)
+                    self._frame_size = frame_size
+
+                now = time.monotonic()
+                sources = [
+                    (source, entry)
+                    for source, entry in self.sources.items()
+                    if entry.schedule(self.is_source_visible(source), now)
+                ]
+                if sources:
+                    self.worker.submit((QVideoFrame(frame), sources, captured_at))
+        finally:
+            self.frame_guard.release()
+            instrumentation.record("process_frame", time.perf_counter() - captured_at)
 
     def get_available_cameras(self):
-        return QCameraInfo.availableCameras()
+        if self.config.frame_source != CAMERA_FRAME_SOURCE:
+            return []
+        return device_registry.devices
 
-    def change_camera_id(self, camera_id: int):
-        self.camera_id = camera_id
-        self.available_cameras = self.get_available_cameras()
-        if not self.available_cameras:
-            print("No camera found.")
-            sys.exit()
+    @property
+    def consumers(self):
+        return set(self.lifecycle.leases)
 
-        self.__init_camera()
+    def start(self, consumer=None, visible=True):
+        # The device keeps running while any visible window holds a lease.
+        return self.lifecycle.acquire(consumer, visible)
+
+    def stop(self, consumer=None):
+        self.lifecycle.release(consumer)
+        self.park_if_unused()
+
+    def set_consumer_visible(self, consumer, visible):
+        self.lifecycle.set_visible(consumer, visible)
 
-    def start(self):
-        self.camera.start()
+    def start_device(self):
+        self.frame_source.start()
 
-    def stop(self):
-        self.camera.stop()
+    def stop_device(self):
+        self.frame_source.stop()
+
+    def park_if_unused(self):
+        # No window is bound to this device any more, e.g. after switching
+        # cameras. It stops at once, so only the new device delivers frames,
+        # and stays loaded until the session cache closes it.
+        if self.sources or self.lifecycle.leases:
+            return
+        self.lifecycle.stop_if_unused()
+        self.lifecycle.linger_timer.stop()
+        Camera.sessions.park(self.camera_id)
+
+    def close(self):
+        self.lifecycle.linger_timer.stop()
+        self.lifecycle.stop_if_unused()
+        self.frame_source.frame_ready.disconnect(self.process_frame)
+        self.frame_source.close()
+        self.frame_source = self.camera = None
+        if self.viewfinder is not None:
+            self.viewfinder.deleteLater()
+            self.viewfinder = None
+
+        QApplication.instance().aboutToQuit.disconnect(self.worker.stop)
+        self.worker.stop()
 
 
 class CameraSource(QWidget):
@@ -678,13 +1318,18 @@ class CameraSource(QWidget):
         camera_source_widget=None,
         add_to_layout=True,
         parent=None,
+        fps=None,
+        display=None,
     ):
         QWidget.__init__(self, parent)
         self.layout = QVBoxLayout(self)
         self.camera_source_widget = camera_source_widget or QLabel()
         self._size = size
+        self.fps = fps
+        self.display = display
         self._process_pixmap_func = None
-        self.camera = Camera(camera_id)
+        self.is_active = False
+        self.camera = Camera.get(camera_id)
 
         self.resize_camera_source_widget()
 
@@ -712,51 +1357,148 @@ class CameraSource(QWidget):
         self.set_process_pixmap(self._process_pixmap_func)
 
     def change_camera_id(self, camera_id: int):
-        self.camera.change_camera_id(camera_id)
-        self.start_camera()
+        # Moves this widget to another device; the old one keeps serving its
+        # other windows.
+        is_active = self.is_active
+        self.stop_camera()
+        self.camera.remove_source(self.camera_source_widget)
+
+        self.camera = Camera.get(camera_id)
+        self.set_process_pixmap(self._process_pixmap_func)
+        if is_active:
+            self.start_camera()
 
     def start_camera(self):
-        self.camera.start()
+        self.is_active = True
+        self.camera.start(self, self.isVisible())
 
     def stop_camera(self):
-        self.camera.stop()
+        self.is_active = False
+        self.camera.stop(self)
+
+    def showEvent(self, event):
+        # Hidden or minimized windows don't keep the device running.
+        self.camera.set_consumer_visible(self, True)
+        return super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.camera.set_consumer_visible(self, False)
+        return super().hideEvent(event)
 
     def set_process_pixmap(self, func):
         self._process_pixmap_func = func
-        self.camera.add_source(self.camera_source_widget, func, self.size)
+        self.camera.add_source(
+            self.camera_source_widget, func, self.size, self.fps, self.display
+        )
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(
+        self, camera_id=None, is_primary=True, export_name=None, overlay_index=None
+    ):
         super().__init__()
 
         self.config = Config()
-        self.config.load()
+        if is_primary:
+            self.config.load()
 
         self.SIZE = self.config.size
-        self.camera_id = self.config.camera_id
+        if camera_id is None:
+            camera_id = self.config.camera_device or self.config.camera_id
+        self.camera_id = resolve_camera_id(camera_id, fallback=is_primary)
+        self.is_primary = is_primary
+        self.overlay_index = overlay_index
+        mask_engine.mode = self.config.pipeline_mode
+        mask_engine.backend = self.config.mask_backend
 
         self.resize(self.SIZE, self.SIZE)
 
-        self.camera_widget = CameraSource(
-            camera_id=self.camera_id, size=(self.SIZE, self.SIZE), parent=self
-        )
-        self.camera_widget.set_process_pixmap(self.circle_image)
+        self.face_tracker = None
+        if self.config.auto_crop:
+            self.face_tracker = FaceTracker(self.config.face_detect_every)
+
+        # Other local processes can map the circle frames instead of
+        # capturing the window, see services.shm_ring.
+        self.frame_export = None
+        if self.config.export_frames:
+            self.frame_export = FrameExport(
+                export_name or self.config.export_frames, self.config.export_slots
+            )
+            QtWidgets.QApplication.instance().aboutToQuit.connect(
+                self.frame_export.close
+            )
+
+        if self.config.display_mode == PAINTER_DISPLAY:
+            circle_widget = CircleFrameWidget()
+            self.camera_widget = CameraSource(
+                camera_id=self.camera_id,
+                size=(self.SIZE, self.SIZE),
+                camera_source_widget=circle_widget,
+                parent=self,
+                display=circle_widget.set_frame,
+            )
+            self.camera_widget.set_process_pixmap(self.crop_frame)
+        else:
+            self.camera_widget = CameraSource(
+                camera_id=self.camera_id, size=(self.SIZE, self.SIZE), parent=self
+            )
+            self.camera_widget.set_process_pixmap(self.circle_image)
 
         self.setCentralWidget(self.camera_widget)
         self.setWindowFlag(Qt.FramelessWindowHint)
         self.setAttribute(Qt.WA_TranslucentBackground)
 
+        # The crop lives here, so the circle needs no settings window. That
+        # one is built on first open only.
+        self.crop_rect = CropRectPublisher()
+        self.crop_rect.on_changed.add(self.on_crop_rect_changed)
+        self.viewfinder_timer = QtCore.QTimer(self)
+        self.viewfinder_timer.setSingleShot(True)
+        self.viewfinder_timer.setInterval(VIEWFINDER_SETTLE_MS)
+        self.viewfinder_timer.timeout.connect(self.negotiate_viewfinder)
+        self.setting_window = None
+        self.watch_frame_size()
+
+        self.overlays = []
         self.is_camera_show = False
         self.show_or_hide_camera()
 
-        self.__init_setting_window()
-        self.__init_systray()
+        # Overlays may sit on another screen than the main circle.
+        self.display_metrics = display_metrics if is_primary else DisplayMetrics()
+        self.display_metrics.track(self)
+        self.display_metrics.on_changed.add(self.on_device_pixel_ratio_changed)
+
+        if is_primary:
+            self.__init_systray()
+            self.__init_overlays()
+        self.negotiate_viewfinder()
 
         self.startPos = None
         QtWidgets.QApplication.instance().installEventFilter(self)
 
+    def __init_overlays(self):
+        # Every overlay is a circle of its own, bound to another camera.
+        for index, camera_id in enumerate(self.config.get_overlay_camera_ids()):
+            try:
+                overlay = MainWindow(
+                    camera_id,
+                    is_primary=False,
+                    export_name=f"{self.config.export_frames}-{index + 1}",
+                    overlay_index=index,
+                )
+            except ValueError as error:
+                print(error)
+                continue
+
+            overlay.move(self.pos() + QtCore.QPoint((index + 1) * self.SIZE, 0))
+            self.overlays.append(overlay)
+
     def eventFilter(self, source, event):
+        # The filter is installed on the application, so only react to the
+        # events of this window.
+        if not isinstance(source, QWidget) or source.window() is not self:
+            return super(MainWindow, self).eventFilter(source, event)
+
         if (
             event.type() == QtCore.QEvent.MouseButtonPress
             and event.button() == QtCore.Qt.LeftButton
@@ -774,18 +1516,118 @@ class MainWindow(QMainWindow):
             return True
         return super(MainWindow, self).eventFilter(source, event)
 
-    def __init_setting_window(self):
-        self.setting_window = SettingsWindow(self.SIZE, self.camera_id)
-        self.setting_window.size_changed.connect(self.change_size)
+    def get_setting_window(self):
+        if self.setting_window is None:
+            self.setting_window = SettingsWindow(
+                self.SIZE, self.camera_id, self.crop_rect, self.overlay_index
+            )
+            self.setting_window.size_changed.connect(self.change_size)
+            self.setting_window.camera_changed.connect(self.change_camera)
+        return self.setting_window
+
+    def watch_frame_size(self):
+        camera = self.camera_widget.camera
+        camera.on_camera_size_changed.add(self.publish_crop)
+        if camera.frame_size.isValid():
+            # The device is already running for another window.
+            self.publish_crop(camera.frame_size)
+
+    def publish_crop(self, size):
+        # The first crop is the centred square, a new frame size keeps the
+        # crop where it was.
+        frame_rect = QRectF(0, 0, size.width(), size.height())
+        self.crop_rect.publish(
+            map_crop(self.crop_rect.snapshot, frame_rect), frame_rect
+        )
+
+    def change_camera(self, camera_id):
+        self.camera_id = camera_id
+        self.camera_widget.camera.on_camera_size_changed.remove(self.publish_crop)
+        self.camera_widget.change_camera_id(camera_id)
+        self.watch_frame_size()
+        if self.face_tracker is not None:
+            self.face_tracker.request_reset()
+        self.negotiate_viewfinder()
+
+    def get_crop_fraction(self):
+        return self.crop_rect.snapshot.crop_fraction
+
+    def negotiate_viewfinder(self):
+        self.camera_widget.camera.negotiate_viewfinder(
+            self.SIZE, self.get_crop_fraction(), self.display_metrics.device_pixel_ratio
+        )
 
-    def circle_image(self, image, size):
-        rect = self.setting_window.get_camera_resize_rect()
-        return mask_image(image, size[0], rect)
+    def discard_output_buffers(self, size, device_pixel_ratio):
+        # Pooled circles of this window at its previous size or ratio would
+        # never be reused.
+        side = int(size * device_pixel_ratio)
+        image_pool.discard(side, side)
+
+    def on_device_pixel_ratio_changed(self, device_pixel_ratio, previous):
+        self.discard_output_buffers(self.SIZE, previous)
+        self.camera_widget.camera.motion_detector.reset()
+        self.negotiate_viewfinder()
+
+    def on_crop_rect_changed(self, snapshot):
+        # A still scene has to be shown again with the new crop, and a
+        # narrower crop may need a larger frame.
+        self.camera_widget.camera.motion_detector.reset()
+        self.viewfinder_timer.start()
+
+    def get_crop_rect(self, frame):
+        # Runs on the frame worker. Falls back to the manual crop until a
+        # face is found. Returns the rect and its crop version, None for a
+        # tracked face.
+        snapshot = self.crop_rect.snapshot
+        if self.face_tracker is None:
+            return snapshot.rect, snapshot.version
+
+        with instrumentation.measure("face_tracking"):
+            width, height = frame.frame.width(), frame.frame.height()
+            step = thumbnail_step(width)
+            face_rect = self.face_tracker.update(
+                *frame.thumbnail(step), step, width, height
+            )
+        if face_rect is None:
+            return snapshot.rect, snapshot.version
+        return face_rect, None
+
+    def circle_image(self, frame, size):
+        dpr = self.display_metrics.device_pixel_ratio
+        rect, _ = self.get_crop_rect(frame)
+        image = mask_image(frame, size[0], rect, dpr)
+        self.export_frame(image)
+        return image
+
+    def crop_frame(self, frame, size):
+        rect, version = self.get_crop_rect(frame)
+        if self.frame_export is not None:
+            # The painter draws the circle itself, so mask a copy to export.
+            dpr = self.display_metrics.device_pixel_ratio
+            image = mask_image(frame, size[0], rect, dpr)
+            self.export_frame(image)
+            image_pool.release(image)
+        return (*frame.crop(rect), version)
+
+    def export_frame(self, image):
+        # Runs on the frame worker.
+        if self.frame_export is not None:
+            with instrumentation.measure("frame_export"):
+                self.frame_export.write(image)
 
     def change_size(self, size):
         self.SIZE = size
-        self.camera_widget.size = (self.SIZE, self.SIZE)
+        self.camera_widget.camera.scheduler.request(
+            self.change_size, self.apply_size, size
+        )
+
+    def apply_size(self, size):
+        previous = self.camera_widget.size[0]
+        self.discard_output_buffers(previous, self.display_metrics.device_pixel_ratio)
+        self.camera_widget.camera.motion_detector.reset()
+        self.camera_widget.size = (size, size)
         self.camera_widget.resize_camera_source_widget()
+        self.negotiate_viewfinder()
 
     def __init_systray(self):
         self.trayIcon = SystemTrayIcon(
@@ -793,9 +1635,41 @@ class MainWindow(QMainWindow):
         )
         self.trayIcon.exitAction.triggered.connect(self.close)
         self.trayIcon.showOrHideAction.triggered.connect(self.show_or_hide_camera)
-        self.trayIcon.settingsAction.triggered.connect(self.setting_window.show)
+        self.trayIcon.settingsAction.triggered.connect(self.show_settings)
+        self.trayIcon.statisticsAction.setChecked(instrumentation.enabled)
+        self.trayIcon.statisticsAction.toggled.connect(instrumentation.enable)
+        self.trayIcon.showStatisticsAction.triggered.connect(self.show_statistics)
         self.trayIcon.show()
 
+    def show_settings(self):
+        for window in [self, *self.overlays]:
+            window.get_setting_window().show()
+
+    def get_statistics(self):
+        return {
+            **instrumentation.summary(),
+            "cameras": Camera.get_all_stats(),
+            "camera_sessions": Camera.sessions.stats(),
+            "devices": device_registry.stats(),
+            "face_trackers": {
+                window.camera_id: window.face_tracker.stats()
+                for window in [self, *self.overlays]
+                if window.face_tracker is not None
+            },
+            "frame_export": {
+                window.camera_id: window.frame_export.stats()
+                for window in [self, *self.overlays]
+                if window.frame_export is not None
+            },
+        }
+
+    def show_statistics(self):
+        QMessageBox.information(
+            self,
+            "Kolo-Face statistics",
+            json.dumps(self.get_statistics(), indent=4, default=str),
+        )
+
     def show_or_hide_camera(self):
         if self.is_camera_show:
             self.camera_widget.stop_camera()
@@ -805,15 +1679,46 @@ class MainWindow(QMainWindow):
             self.show()
 
         self.is_camera_show = not self.is_camera_show
+        for overlay in self.overlays:
+            if overlay.is_camera_show != self.is_camera_show:
+                overlay.show_or_hide_camera()
 
     def closeEvent(self, a0) -> None:
-        self.setting_window.close()
+        if self.setting_window is not None:
+            self.setting_window.close()
+        for overlay in self.overlays:
+            overlay.close()
+        if self.frame_export is not None:
+            self.frame_export.close()
         return super().closeEvent(a0)
 
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="kolo-face")
+    parser.add_argument(
+        "--stats-file",
+        help="collect frame pipeline statistics and dump them as JSON on exit",
+    )
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
 if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
     app = QApplication([])
     app.setApplicationName("Kolo-Face")
+
+    if args.stats_file:
+        instrumentation.enable()
+
     window = MainWindow()
     window.show()
+
+    if args.stats_file:
+        app.aboutToQuit.connect(
+            lambda: instrumentation.dump(
+                args.stats_file, {"cameras": Camera.get_all_stats()}
+            )
+        )
+
     sys.exit(app.exec_())
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+
+class SessionCache:
+    # Open capture sessions by device. A session nobody uses any more is
+    # parked warm, so switching back to its device skips opening it again;
+    # beyond `warm` parked sessions the least recently used one is closed.
+    def __init__(self, create, close, warm=2):
+        self.create = create
+        self.close = close
+        self.warm = warm
+        self.sessions = {}
+        self.idle = OrderedDict()
+
+        self.opened = 0
+        self.reused = 0
+        self.closed = 0
+
+    def __iter__(self):
+        return iter(list(self.sessions.items()))
+
+    def get(self, key):
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = self.create(key)
+            self.opened += 1
+        elif self.idle.pop(key, None) is not None:
+            self.reused += 1
+        return session
+
+    def park(self, key):
+        if key not in self.sessions:
+            return
+        self.idle[key] = True
+        self.idle.move_to_end(key)
+        self.trim()
+
+    def trim(self):
+        while len(self.idle) > max(self.warm, 0):
+            key, _ = self.idle.popitem(last=False)
+            self.discard(key)
+
+    def discard(self, key):
+        self.idle.pop(key, None)
+        session = self.sessions.pop(key, None)
+        if session is not None:
+            self.closed += 1
+            self.close(session)
+
+    def close_all(self):
+        for key in list(self.sessions):
+            self.discard(key)
+
+    def stats(self):
+        return {
+            "open": list(self.sessions),
+            "warm": list(self.idle),
+            "opened": self.opened,
+            "reused": self.reused,
+            "closed": self.closed,
+        }
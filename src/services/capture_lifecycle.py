@@ -0,0 +1,103 @@
+from PyQt5.QtCore import QObject, QTimer
+
+
+class CaptureLease:
+    def __init__(self, lifecycle, consumer, visible=True):
+        self.lifecycle = lifecycle
+        self.consumer = consumer
+        self.visible = visible
+
+    def set_visible(self, visible):
+        self.lifecycle.set_visible(self.consumer, visible)
+
+    def release(self):
+        self.lifecycle.release(self.consumer)
+
+
+class CaptureLifecycle(QObject):
+    # Runs a capture device while at least one visible consumer holds a
+    # lease. The stop lingers for a while, so hiding and showing a window
+    # again does not pay for reopening the device.
+    def __init__(self, start, stop, linger=2000, parent=None):
+        super().__init__(parent)
+        self._start = start
+        self._stop = stop
+        self.leases = {}
+        self.running = False
+
+        self.acquired = 0
+        self.released = 0
+        self.starts = 0
+        self.stops = 0
+        self.stops_avoided = 0
+
+        self.linger_timer = QTimer(self)
+        self.linger_timer.setSingleShot(True)
+        self.linger_timer.setInterval(linger)
+        self.linger_timer.timeout.connect(self.stop_if_unused)
+
+    @property
+    def linger(self):
+        return self.linger_timer.interval()
+
+    @linger.setter
+    def linger(self, linger):
+        self.linger_timer.setInterval(linger)
+
+    def acquire(self, consumer, visible=True):
+        # A consumer holds at most one lease, acquiring again only updates
+        # its visibility.
+        lease = self.leases.get(consumer)
+        if lease is None:
+            lease = self.leases[consumer] = CaptureLease(self, consumer, visible)
+            self.acquired += 1
+        lease.visible = visible
+        self.update()
+        return lease
+
+    def release(self, consumer):
+        if self.leases.pop(consumer, None) is not None:
+            self.released += 1
+            self.update()
+
+    def set_visible(self, consumer, visible):
+        lease = self.leases.get(consumer)
+        if lease is not None and lease.visible != visible:
+            lease.visible = visible
+            self.update()
+
+    def is_wanted(self):
+        return any(lease.visible for lease in self.leases.values())
+
+    def update(self):
+        if self.is_wanted():
+            if self.linger_timer.isActive():
+                self.linger_timer.stop()
+                self.stops_avoided += 1
+            if not self.running:
+                self.running = True
+                self.starts += 1
+                self._start()
+        elif self.running and not self.linger_timer.isActive():
+            if self.linger > 0:
+                self.linger_timer.start()
+            else:
+                self.stop_if_unused()
+
+    def stop_if_unused(self):
+        if self.running and not self.is_wanted():
+            self.running = False
+            self.stops += 1
+            self._stop()
+
+    def stats(self):
+        return {
+            "leases": len(self.leases),
+            "visible_leases": sum(lease.visible for lease in self.leases.values()),
+            "acquired": self.acquired,
+            "released": self.released,
+            "starts": self.starts,
+            "stops": self.stops,
+            "stops_avoided": self.stops_avoided,
+            "running": self.running,
+        }
@@ -0,0 +1,163 @@
+from collections import namedtuple
+
+import numpy as np
+
+from PyQt5.QtCore import QRect, QRectF
+
+from services.callbacks import Callbacks
+
+
+class CropSnapshot(
+    namedtuple(
+        "CropSnapshot",
+        ["x", "y", "width", "height", "frame_width", "frame_height", "version"],
+    )
+):
+    # Crop rect in frame pixels. Being immutable, a reader can never see a
+    # half-updated crop; the version tells derived values when to rebuild.
+    __slots__ = ()
+
+    @property
+    def rect(self):
+        return QRect(self.x, self.y, self.width, self.height)
+
+    @property
+    def crop_fraction(self):
+        side = min(self.frame_width, self.frame_height)
+        if not side or not self.height:
+            return 1.0
+        return self.height / side
+
+    def is_empty(self):
+        return self.width <= 0 or self.height <= 0
+
+
+EMPTY_CROP = CropSnapshot(0, 0, 0, 0, 0, 0, 0)
+
+
+def centered_square(frame_rect):
+    # The default crop, as the resize editor starts with it.
+    side = min(frame_rect.width(), frame_rect.height())
+    return QRectF(
+        frame_rect.x() + (frame_rect.width() - side) // 2,
+        frame_rect.y() + (frame_rect.height() - side) // 2,
+        side,
+        side,
+    )
+
+
+def map_crop(snapshot, frame_rect):
+    # The crop moved to another frame size: same relative centre and same
+    # share of the short side, so the circle keeps showing the same part of
+    # the scene across a resolution switch.
+    if snapshot.is_empty() or not snapshot.frame_width or not snapshot.frame_height:
+        return centered_square(frame_rect)
+
+    width, height = frame_rect.width(), frame_rect.height()
+    scale = min(width, height) / min(snapshot.frame_width, snapshot.frame_height)
+    crop_width = min(snapshot.width * scale, width)
+    crop_height = min(snapshot.height * scale, height)
+    center_x = (snapshot.x + snapshot.width / 2) * width / snapshot.frame_width
+    center_y = (snapshot.y + snapshot.height / 2) * height / snapshot.frame_height
+    x = min(max(center_x - crop_width / 2, 0), width - crop_width)
+    y = min(max(center_y - crop_height / 2, 0), height - crop_height)
+    return QRectF(
+        frame_rect.x() + round(x),
+        frame_rect.y() + round(y),
+        round(crop_width),
+        round(crop_height),
+    )
+
+
+class CropRectPublisher:
+    # Written on the GUI thread when the crop changes. Readers, including the
+    # frame worker, take `snapshot` once per frame: replacing the reference
+    # is atomic, so no lock is needed.
+    def __init__(self):
+        self.snapshot = EMPTY_CROP
+        self.on_changed = Callbacks()
+
+    def publish(self, rect, frame_rect):
+        values = (
+            int(rect.x()),
+            int(rect.y()),
+            int(rect.width()),
+            int(rect.height()),
+            int(frame_rect.width()),
+            int(frame_rect.height()),
+        )
+        if values == self.snapshot[:-1]:
+            return self.snapshot
+
+        self.snapshot = CropSnapshot(*values, self.snapshot.version + 1)
+        self.on_changed.send(self.snapshot)
+        return self.snapshot
+
+
+def scale_rect(rect, scale):
+    return QRectF(
+        rect.x() * scale, rect.y() * scale, rect.width() * scale, rect.height() * scale
+    )
+
+
+def half_widths(radius_x, radius_y, distances):
+    if radius_y <= 0:
+        return np.zeros_like(distances)
+    ratio = np.minimum(distances / radius_y, 1.0)
+    return radius_x * np.sqrt(1 - ratio**2)
+
+
+def ellipse_outline_bands(rect, y0, y1, margin):
+    # Left and right x ranges of the ellipse outline in rect, margin pixels
+    # thick, within each band y0..y1, and which bands it crosses at all.
+    center = rect.center()
+    radius_x, radius_y = rect.width() / 2, rect.height() / 2
+
+    distances = np.abs(np.stack([y0, y1]) - center.y())
+    near = np.where((y0 <= center.y()) & (center.y() <= y1), 0, distances.min(0))
+    crosses = near <= radius_y + margin
+
+    # Near the tips the outline is almost flat, so a pixel of height moves
+    # it by a lot: take the band margin pixels taller on both sides.
+    inner = half_widths(radius_x - margin, radius_y - margin, distances.max(0) + margin)
+    outer = half_widths(
+        radius_x + margin, radius_y + margin, np.maximum(near - margin, 0)
+    )
+    left = (center.x() - outer - margin, center.x() - inner + margin)
+    right = (center.x() + inner - margin, center.x() + outer + margin)
+    return left, right, crosses
+
+
+def crop_change_rects(old, new, margin=2, band=32):
+    # What a crop editor has to repaint when the crop goes from old to new:
+    # the strips between the old and new edges, where the dimming and the
+    # outline change, and a rect per band on either side of both circles.
+    united = old.united(new)
+    top, bottom = united.top() - margin, united.bottom() + margin
+    height = bottom - top
+    for a, b in ((old.left(), new.left()), (old.right(), new.right())):
+        if a != b:
+            yield QRectF(min(a, b) - margin, top, abs(a - b) + 2 * margin, height)
+
+    left, width = united.left() - margin, united.width() + 2 * margin
+    for a, b in ((old.top(), new.top()), (old.bottom(), new.bottom())):
+        if a != b:
+            yield QRectF(left, min(a, b) - margin, width, abs(a - b) + 2 * margin)
+
+    y0 = np.arange(top, bottom, band)
+    y1 = np.minimum(y0 + band, bottom)
+    old_left, old_right, old_crosses = ellipse_outline_bands(old, y0, y1, margin)
+    new_left, new_right, new_crosses = ellipse_outline_bands(new, y0, y1, margin)
+
+    for (old_x0, old_x1), (new_x0, new_x1) in (
+        (old_left, new_left),
+        (old_right, new_right),
+    ):
+        x0 = np.where(old_crosses, old_x0, np.inf)
+        x0 = np.minimum(x0, np.where(new_crosses, new_x0, np.inf))
+        x1 = np.where(old_crosses, old_x1, -np.inf)
+        x1 = np.maximum(x1, np.where(new_crosses, new_x1, -np.inf))
+        crosses = old_crosses | new_crosses
+        bands = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1)[crosses]
+        for x, y, width, height in bands.tolist():
+            yield QRectF(x, y, width, height)
@@ -0,0 +1,190 @@
+import numpy as np
+
+from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QImage
+from PyQt5.QtMultimedia import QAbstractVideoBuffer, QVideoFrame
+
+from services.frame_sources import video_frame_from_bytes
+from services.mask_engine import to_rect
+from services.numpy_frames import FORMATS_32BPP, image_to_array
+from services.yuv import (
+    RGB32_CHANNELS,
+    align_rect,
+    crop_nv12,
+    crop_nv21,
+    crop_packed_bytes,
+    crop_semi_planar_bytes,
+    crop_uyvy,
+    crop_yuyv,
+    rgb_to_yuv,
+)
+
+
+YUV_CROPPERS = {
+    QVideoFrame.Format_YUYV: crop_yuyv,
+    QVideoFrame.Format_UYVY: crop_uyvy,
+    QVideoFrame.Format_NV12: crop_nv12,
+    QVideoFrame.Format_NV21: crop_nv21,
+}
+
+FRAME_CROPPERS = {
+    QVideoFrame.Format_YUYV: crop_packed_bytes,
+    QVideoFrame.Format_UYVY: crop_packed_bytes,
+    QVideoFrame.Format_NV12: crop_semi_planar_bytes,
+    QVideoFrame.Format_NV21: crop_semi_planar_bytes,
+}
+
+# Above this share of the frame, copying the crop out costs more than
+# converting the rest of the frame along with it.
+MAX_NATIVE_CROP_AREA = 0.75
+
+
+class DecodeStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.decodes = 0
+        self.requests = 0
+        self.native_crops = 0
+
+    @property
+    def decodes_per_frame(self):
+        return self.decodes / self.frames if self.frames else 0.0
+
+
+class DecodedFrame:
+    # Maps and converts a QVideoFrame at most once and hands the same
+    # QImage to every consumer until released. Native crops belong to the
+    # caller.
+    def __init__(self, frame, stats=None):
+        self.frame = frame
+        self.stats = stats or DecodeStats()
+        self.stats.frames += 1
+        self._image = None
+
+    @property
+    def image(self):
+        self.stats.requests += 1
+        if self._image is None:
+            self._image = self.frame.image()
+            self.stats.decodes += 1
+        return self._image
+
+    def crop(self, rect):
+        # Returns an image and the rect to use inside it. YUV frames are
+        # cropped before the color conversion, so only the crop is converted.
+        rect = to_rect(rect)
+        if self._image is None:
+            image = self.crop_native(rect)
+            if image is not None:
+                self.stats.native_crops += 1
+                aligned = align_rect(rect)
+                return image, rect.translated(-aligned.x(), -aligned.y())
+
+        return self.image, rect
+
+    def crop_native(self, rect):
+        # The crop planes are copied into a frame of their own, which Qt
+        # converts: its converter is much faster than one in NumPy.
+        pixel_format = self.frame.pixelFormat()
+        cropper = FRAME_CROPPERS.get(pixel_format)
+        if cropper is None:
+            return None
+
+        width, height = self.frame.width(), self.frame.height()
+        rect = align_rect(rect)
+        if not (0 <= rect.x() and rect.right() < width):
+            return None
+        if not (0 <= rect.y() and rect.bottom() < height):
+            return None
+        if rect.width() * rect.height() > MAX_NATIVE_CROP_AREA * width * height:
+            return None
+
+        if not self.frame.map(QAbstractVideoBuffer.ReadOnly):
+            return None
+
+        try:
+            planes, strides = self.map_planes(height)
+            data, bytes_per_line = cropper(planes, strides, height, rect)
+        finally:
+            self.frame.unmap()
+
+        crop = video_frame_from_bytes(
+            data, rect.width(), rect.height(), bytes_per_line, pixel_format
+        )
+        return crop.image()
+
+    def thumbnail(self, step):
+        # Every step-th pixel as luma, u and v arrays for frame analysis.
+        # YUV frames are sampled straight from the planes, without decoding.
+        cropper = YUV_CROPPERS.get(self.frame.pixelFormat())
+        if cropper is not None and self._image is None:
+            planes = self.thumbnail_native(cropper, step)
+            if planes is not None:
+                return planes
+
+        image = self.image
+        if image.format() not in FORMATS_32BPP:
+            image = image.convertToFormat(QImage.Format_RGB32)
+
+        b, g, r, a = RGB32_CHANNELS
+        pixels = image_to_array(image)[::step, ::step]
+        return rgb_to_yuv(pixels[..., [r, g, b]])
+
+    def preview(self, width, height):
+        # The whole frame reduced to width x height. Decimating YUV planes and
+        # converting them in NumPy is slower than Qt decoding and scaling.
+        return self.image.scaled(width, height)
+
+    def thumbnail_native(self, cropper, step):
+        # Rows are skipped through a larger stride, so only every step-th
+        # row of the frame is ever read.
+        width = self.frame.width() & ~1
+        rows = (self.frame.height() // step) & ~1
+        if not self.frame.map(QAbstractVideoBuffer.ReadOnly):
+            return None
+
+        try:
+            planes, strides = self.map_planes(self.frame.height())
+            strides = [stride * step for stride in strides]
+            luma, u, v = cropper(planes, strides, rows, QRect(0, 0, width, rows))
+
+            columns = np.arange(0, width, step)
+            chroma = np.ix_(
+                np.arange(rows) * u.shape[0] // rows, columns * u.shape[1] // width
+            )
+            return luma[:, ::step].copy(), u[chroma], v[chroma]
+        finally:
+            self.frame.unmap()
+
+    def map_planes(self, height):
+        frame = self.frame
+        size = frame.mappedBytes()
+        if frame.planeCount() > 1:
+            planes, strides = [], []
+            for plane in range(frame.planeCount()):
+                bits = frame.bits(plane)
+                bits.setsize(size - int(bits) + int(frame.bits(0)))
+                planes.append(np.frombuffer(bits, np.uint8))
+                strides.append(frame.bytesPerLine(plane))
+            return planes, strides
+
+        bits = frame.bits()
+        bits.setsize(size)
+        data = np.frombuffer(bits, np.uint8)
+        stride = frame.bytesPerLine()
+
+        # Single plane mapping of a semi-planar format: chroma follows luma.
+        return [data, data[stride * height :]], [stride, stride]
+
+    def release(self):
+        self._image = None
+        self.frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
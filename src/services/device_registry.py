@@ -0,0 +1,156 @@
+import ctypes
+import glob
+import os
+import sys
+import uuid
+from collections import namedtuple
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer
+from PyQt5.QtMultimedia import QCameraInfo
+
+from services.callbacks import Callbacks
+
+
+DeviceInfo = namedtuple("DeviceInfo", ["id", "description", "info"])
+
+DEVICE_FOLDER = "/dev"
+BY_ID_FOLDER = "/dev/v4l/by-id"
+KSCATEGORY_VIDEO = uuid.UUID("6994ad05-93ef-11d0-a3cc-00a0c9223196")
+
+
+def stable_device_id(device_name):
+    # udev's by-id links survive re-plugging and reordering, /dev/videoN
+    # names don't.
+    if os.path.isdir(BY_ID_FOLDER):
+        real_path = os.path.realpath(device_name)
+        for link in sorted(os.listdir(BY_ID_FOLDER)):
+            if os.path.realpath(os.path.join(BY_ID_FOLDER, link)) == real_path:
+                return link
+    return device_name
+
+
+def present_video_interfaces():
+    # The configuration manager lists the plugged video interfaces without
+    # opening any of them, which a DirectShow enumeration does.
+    cfgmgr32 = ctypes.WinDLL("cfgmgr32")
+    guid = ctypes.create_string_buffer(KSCATEGORY_VIDEO.bytes_le, 16)
+    size = ctypes.c_ulong()
+    if cfgmgr32.CM_Get_Device_Interface_List_SizeW(ctypes.byref(size), guid, None, 0):
+        return None
+    buffer = ctypes.create_unicode_buffer(size.value)
+    if cfgmgr32.CM_Get_Device_Interface_ListW(guid, None, buffer, size, 0):
+        return None
+    return tuple(name for name in buffer[: size.value].split("\0") if name)
+
+
+class DeviceRegistry(QObject):
+    # Enumerates cameras once and again only when devices come or go.
+    # Probing every video node is slow, so where /dev can be watched it is
+    # the hot-plug signal, elsewhere a cheap signature of it is polled.
+    def __init__(
+        self,
+        enumerate_cameras=QCameraInfo.availableCameras,
+        device_folder=DEVICE_FOLDER,
+        settle_delay=500,
+        poll_interval=5000,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.enumerate_cameras = enumerate_cameras
+        self.device_folder = device_folder
+        self._devices = None
+        self._signature = None
+        self.enumerations = 0
+        self.on_changed = Callbacks()
+
+        self.poll_interval = poll_interval
+        self.watcher = None
+        self.poll_timer = None
+
+        # Nodes show up in bursts and get their permissions a bit later.
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(settle_delay)
+        self.settle_timer.timeout.connect(self.refresh)
+
+    @property
+    def devices(self):
+        if self._devices is None:
+            self.refresh(force=True)
+            self.start_monitoring()
+        return self._devices
+
+    def start_monitoring(self):
+        if self.watcher is not None or self.poll_timer is not None:
+            return
+
+        if os.path.isdir(self.device_folder):
+            self.watcher = QFileSystemWatcher([self.device_folder], self)
+            self.watcher.directoryChanged.connect(self.schedule_refresh)
+        else:
+            self.poll_timer = QTimer(self)
+            self.poll_timer.setInterval(self.poll_interval)
+            self.poll_timer.timeout.connect(self.refresh)
+            self.poll_timer.start()
+
+    def schedule_refresh(self, *args):
+        self.settle_timer.start()
+
+    def device_nodes(self):
+        return tuple(sorted(glob.glob(os.path.join(self.device_folder, "video*"))))
+
+    def device_signature(self):
+        # Something cheap that changes with the cameras, None when there is
+        # nothing better than enumerating them.
+        if os.path.isdir(self.device_folder):
+            return self.device_nodes()
+        if sys.platform == "win32":
+            return present_video_interfaces()
+        return None
+
+    def refresh(self, force=False):
+        # Most /dev changes and polls are not cameras, those cost a glob or
+        # an interface list only.
+        signature = self.device_signature()
+        unchanged = signature is not None and signature == self._signature
+        if not force and unchanged:
+            return False
+        self._signature = signature
+
+        devices = [
+            DeviceInfo(stable_device_id(info.deviceName()), info.description(), info)
+            for info in self.enumerate_cameras()
+        ]
+        self.enumerations += 1
+
+        previous, self._devices = self._devices, devices
+        if previous is None:
+            return False
+        if [device.id for device in previous] == [device.id for device in devices]:
+            return False
+
+        self.on_changed.send(devices)
+        return True
+
+    def find(self, device_id):
+        for device in self.devices:
+            if device.id == device_id:
+                return device
+        return None
+
+    def index_of(self, device_id):
+        for index, device in enumerate(self.devices):
+            if device.id == device_id:
+                return index
+        return -1
+
+    def id_at(self, index):
+        devices = self.devices
+        return devices[index].id if 0 <= index < len(devices) else None
+
+    def stats(self):
+        return {
+            "devices": [device.id for device in self.devices],
+            "enumerations": self.enumerations,
+            "hot_plug": "watcher" if self.watcher is not None else "polling",
+        }
@@ -0,0 +1,76 @@
+from PyQt5.QtCore import QRect
+
+from services.callbacks import Callbacks
+
+
+class DisplayMetrics:
+    # Screen metrics of the tracked window, read once and refreshed only when
+    # Qt reports a change. The frame worker reads device_pixel_ratio without
+    # touching any window or screen object. Listeners get the new and the
+    # previous ratio.
+    def __init__(self):
+        self.device_pixel_ratio = 1.0
+        self.geometry = QRect()
+        self.available_geometry = QRect()
+        self.screen = None
+        self.changes = 0
+        self.on_changed = Callbacks()
+
+    def track(self, widget):
+        # Creates the native window if needed, so call it after the window
+        # flags are set.
+        widget.winId()
+        widget.windowHandle().screenChanged.connect(self.set_screen)
+        self.set_screen(widget.windowHandle().screen())
+
+    def set_screen(self, screen):
+        if self.screen is not None:
+            for signal in self._screen_signals(self.screen):
+                signal.disconnect(self.refresh)
+
+        self.screen = screen
+        if screen is not None:
+            for signal in self._screen_signals(screen):
+                signal.connect(self.refresh)
+        self.refresh()
+
+    @staticmethod
+    def _screen_signals(screen):
+        # The device pixel ratio changes along with the screen DPI.
+        return (
+            screen.geometryChanged,
+            screen.availableGeometryChanged,
+            screen.logicalDotsPerInchChanged,
+            screen.physicalDotsPerInchChanged,
+        )
+
+    def refresh(self, *args):
+        if self.screen is None:
+            return
+
+        self.update(
+            self.screen.devicePixelRatio(),
+            self.screen.geometry(),
+            self.screen.availableGeometry(),
+        )
+
+    def update(self, device_pixel_ratio, geometry=None, available_geometry=None):
+        if geometry is not None:
+            self.geometry = QRect(geometry)
+        if available_geometry is not None:
+            self.available_geometry = QRect(available_geometry)
+
+        if device_pixel_ratio == self.device_pixel_ratio:
+            return
+
+        previous, self.device_pixel_ratio = self.device_pixel_ratio, device_pixel_ratio
+        self.changes += 1
+        self.on_changed.send(device_pixel_ratio, previous)
+
+    def stats(self):
+        return {
+            "device_pixel_ratio": self.device_pixel_ratio,
+            "screen": self.screen.name() if self.screen is not None else None,
+            "geometry": self.geometry.getRect(),
+            "changes": self.changes,
+        }
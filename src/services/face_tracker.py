@@ -0,0 +1,181 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from PyQt5.QtCore import QRectF
+
+
+THUMBNAIL_WIDTH = 160
+
+# BT.601 chroma ranges of skin tones (Chai & Ngan), valid for any lighting
+# that is not extremely dark.
+SKIN_U = (77, 127)
+SKIN_V = (133, 173)
+MIN_SKIN_LUMA = 40
+
+DETECTION_SCALES = (0.2, 0.3, 0.45, 0.6)
+
+
+def thumbnail_step(width, target=THUMBNAIL_WIDTH):
+    return max(1, round(width / target))
+
+
+def skin_mask(luma, u, v):
+    return (
+        (u >= SKIN_U[0])
+        & (u <= SKIN_U[1])
+        & (v >= SKIN_V[0])
+        & (v <= SKIN_V[1])
+        & (luma > MIN_SKIN_LUMA)
+    )
+
+
+def integral_image(mask):
+    height, width = mask.shape
+    table = np.zeros((height + 1, width + 1), np.int32)
+    np.cumsum(np.cumsum(mask, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+    return table
+
+
+def detect_face(luma, u, v, scales=DETECTION_SCALES, min_density=0.5):
+    # Finds the square with the most skin pixels minus non-skin pixels over
+    # a few window sizes. Returns (x, y, side) in thumbnail pixels or None.
+    mask = skin_mask(luma, u, v)
+    table = integral_image(mask)
+    height, width = mask.shape
+
+    best, best_score = None, 0
+    for scale in scales:
+        side = max(4, int(min(height, width) * scale))
+        sums = (
+            table[side:, side:]
+            - table[:-side, side:]
+            - table[side:, :-side]
+            + table[:-side, :-side]
+        )
+        scores = 2 * sums - side * side
+
+        y, x = np.unravel_index(np.argmax(scores), scores.shape)
+        if scores[y, x] > best_score and sums[y, x] >= min_density * side * side:
+            best, best_score = (int(x), int(y), side), scores[y, x]
+
+    return best
+
+
+def match_template(image, template, x, y, radius):
+    # Zero-mean SSD over positions within radius of (x, y), so exposure
+    # changes do not move the match. Returns the best position and its error
+    # relative to the template variance.
+    height, width = image.shape
+    template_height, template_width = template.shape
+
+    x0, y0 = max(0, x - radius), max(0, y - radius)
+    x1 = min(width - template_width, x + radius)
+    y1 = min(height - template_height, y + radius)
+    if x1 < x0 or y1 < y0:
+        return x, y, np.inf
+
+    region = image[y0 : y1 + template_height, x0 : x1 + template_width]
+    windows = sliding_window_view(region.astype(np.float32), template.shape)
+    windows = windows - windows.mean(axis=(2, 3), keepdims=True)
+
+    template = template - template.mean()
+    difference = windows - template
+    cost = np.einsum("ijkl,ijkl->ij", difference, difference)
+
+    iy, ix = np.unravel_index(np.argmin(cost), cost.shape)
+    error = cost[iy, ix] / template.size / max(float(template.var()), 1.0)
+    return x0 + int(ix), y0 + int(iy), error
+
+
+class FaceTracker:
+    # Detects the face every detect_every frames and follows it with
+    # template matching in between. Works on thumbnails, see thumbnail_step.
+    def __init__(
+        self,
+        detect_every=10,
+        margin=1.8,
+        smoothing=0.5,
+        search_radius=0.4,
+        max_error=0.5,
+    ):
+        self.detect_every = detect_every
+        self.margin = margin
+        self.smoothing = smoothing
+        self.search_radius = search_radius
+        self.max_error = max_error
+
+        self.detections = 0
+        self.tracked = 0
+        self.lost = 0
+        self._reset_pending = False
+        self.reset()
+
+    def request_reset(self):
+        # update() runs on the frame worker, so other threads only flag the
+        # reset and the next update() carries it out.
+        self._reset_pending = True
+
+    def reset(self):
+        self.box = None
+        self.template = None
+        self.shape = None
+        self.frame_index = 0
+        self.rect = None
+        self._state = None
+
+    def update(self, luma, u, v, step, frame_width, frame_height):
+        # Returns the smoothed square crop in frame pixels, or None while no
+        # face has been found.
+        if self._reset_pending:
+            self._reset_pending = False
+            self.reset()
+
+        if luma.shape != self.shape:
+            self.reset()
+            self.shape = luma.shape
+
+        if self.box is None or self.frame_index % self.detect_every == 0:
+            self.detections += 1
+            box = detect_face(luma, u, v)
+            if box is not None:
+                x, y, side = box
+                self.box = box
+                self.template = luma[y : y + side, x : x + side].astype(np.float32)
+        else:
+            x, y, side = self.box
+            radius = max(2, int(side * self.search_radius))
+            x, y, error = match_template(luma, self.template, x, y, radius)
+            if error > self.max_error:
+                self.lost += 1
+                self.box = None
+            else:
+                self.tracked += 1
+                self.box = (x, y, side)
+
+        self.frame_index += 1
+        if self.box is not None:
+            self.rect = self.smooth(self.box, step, frame_width, frame_height)
+        return self.rect
+
+    def smooth(self, box, step, frame_width, frame_height):
+        x, y, side = box
+        target = np.array(
+            [(x + side / 2) * step, (y + side / 2) * step, side * step * self.margin]
+        )
+        if self._state is None:
+            self._state = target
+        else:
+            self._state += self.smoothing * (target - self._state)
+
+        center_x, center_y, side = self._state
+        side = min(side, frame_width, frame_height)
+        left = min(max(center_x - side / 2, 0), frame_width - side)
+        top = min(max(center_y - side / 2, 0), frame_height - side)
+        return QRectF(left, top, side, side)
+
+    def stats(self):
+        return {
+            "detections": self.detections,
+            "tracked": self.tracked,
+            "lost": self.lost,
+        }
@@ -0,0 +1,55 @@
+import threading
+
+from PyQt5.QtGui import QImage
+
+from services.numpy_frames import image_to_array
+from services.shm_ring import RingWriter, SHM_FOLDER
+
+
+class FrameExport:
+    # Publishes the circle frames of one window into a shared-memory ring,
+    # see services.shm_ring. Frames are written on the frame worker, while
+    # the window closes the ring on the GUI thread, hence the lock.
+    def __init__(self, name, slots=4, folder=SHM_FOLDER):
+        self.name = name
+        self.slots = slots
+        self.folder = folder
+        self.writer = None
+        self.reallocations = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def write(self, image, timestamp_ns=None):
+        width, height = image.width(), image.height()
+        with self._lock:
+            if self._closed:
+                return None
+
+            writer = self.writer
+            if writer is None or width > writer.max_width or height > writer.max_height:
+                # Readers follow the name to the new ring.
+                if writer is not None:
+                    writer.close()
+                    self.reallocations += 1
+                writer = self.writer = RingWriter(
+                    self.name, width, height, self.slots, self.folder
+                )
+
+            # Readers get straight alpha. Converting first and copying the
+            # rows is faster than painting into the shared pages.
+            rgba = image.convertToFormat(QImage.Format_RGBA8888)
+            return writer.write(image_to_array(rgba), timestamp_ns)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self.writer is not None:
+                self.writer.close()
+
+    def stats(self):
+        writer = self.writer
+        return {
+            "name": self.name,
+            "reallocations": self.reallocations,
+            **(writer.stats() if writer is not None else {}),
+        }
@@ -0,0 +1,52 @@
+from PyQt5.QtCore import QObject, QTimer
+
+
+class ReentrancyGuard:
+    def __init__(self):
+        self.active = False
+        self.avoided = 0
+
+    def acquire(self):
+        if self.active:
+            self.avoided += 1
+            return False
+
+        self.active = True
+        return True
+
+    def release(self):
+        self.active = False
+
+
+class FrameScheduler(QObject):
+    # Collects requests by key and runs only the latest request for every
+    # key on the next event loop iteration.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.requested = 0
+        self.coalesced = 0
+        self.dispatched = 0
+        self._pending = {}
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self.flush)
+
+    def request(self, key, callback, *args):
+        self.requested += 1
+        if key in self._pending:
+            self.coalesced += 1
+
+        self._pending[key] = (callback, args)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def cancel(self, key):
+        self._pending.pop(key, None)
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        for callback, args in pending.values():
+            self.dispatched += 1
+            callback(*args)
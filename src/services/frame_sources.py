@@ -0,0 +1,277 @@
+from pathlib import Path
+
+import numpy as np
+
+from PyQt5.QtCore import QObject, QSize, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader
+from PyQt5.QtMultimedia import (
+    QAbstractVideoBuffer,
+    QCamera,
+    QVideoFrame,
+    QVideoProbe,
+)
+
+from services.numpy_frames import image_to_array
+from services.yuv import RGB32_CHANNELS, pack_nv12, pack_yuyv
+
+
+CAMERA_FRAME_SOURCE = "camera"
+SYNTHETIC_FRAME_SOURCE = "synthetic"
+REPLAY_FRAME_SOURCE = "replay"
+
+PATTERNS = ("gradient", "bars", "noise", "moving", "face")
+PIXEL_FORMATS = {
+    "rgb32": QVideoFrame.Format_RGB32,
+    "yuyv": QVideoFrame.Format_YUYV,
+    "nv12": QVideoFrame.Format_NV12,
+}
+
+
+class FrameSource(QObject):
+    frame_ready = pyqtSignal(QVideoFrame)
+
+    def start(self):
+        ...
+
+    def stop(self):
+        ...
+
+    def close(self):
+        self.stop()
+
+    def is_active(self):
+        return False
+
+
+class CameraFrameSource(FrameSource):
+    def __init__(self, camera_info, viewfinder=None, parent=None):
+        super().__init__(parent)
+        self.camera = QCamera(camera_info)
+        self.camera.setCaptureMode(QCamera.CaptureViewfinder)
+        if viewfinder is not None:
+            self.camera.setViewfinder(viewfinder)
+
+        self.probe = QVideoProbe(self.camera)
+        self.probe.videoFrameProbed.connect(self.frame_ready)
+        self.probe.setSource(self.camera)
+
+    def start(self):
+        self.camera.start()
+
+    def stop(self):
+        self.camera.stop()
+
+    def close(self):
+        # A stopped camera stays loaded and its probe keeps its source, so
+        # both are let go of here for good.
+        self.probe.videoFrameProbed.disconnect(self.frame_ready)
+        self.probe.setSource(None)
+        self.camera.unload()
+        self.probe.deleteLater()
+        self.camera.deleteLater()
+
+    def is_active(self):
+        return self.camera.state() == QCamera.ActiveState
+
+
+class TimedFrameSource(FrameSource):
+    # Delivers prepared frames in a loop at a fixed rate.
+    def __init__(self, frames, fps=30, parent=None):
+        super().__init__(parent)
+        self.frames = frames
+        self.index = 0
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(round(1000 / fps))
+        self.timer.timeout.connect(self.emit_next_frame)
+
+    def next_frame(self):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame
+
+    def emit_next_frame(self):
+        self.frame_ready.emit(self.next_frame())
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def is_active(self):
+        return self.timer.isActive()
+
+
+def face_position(width, height, index, period=30):
+    # Center and half axes of the "face" pattern: a slow sway, like leaning
+    # from side to side, that loops every period frames.
+    phase = 2 * np.pi * index / period
+    center_x = width * (0.5 + 0.2 * np.sin(phase))
+    center_y = height * (0.5 + 0.06 * np.sin(2 * phase))
+    return center_x, center_y, height / 7, height / 5
+
+
+def ellipse(width, height, center_x, center_y, radius_x, radius_y):
+    x = (np.arange(width) - center_x) / radius_x
+    y = (np.arange(height)[:, None] - center_y) / radius_y
+    return x**2 + y**2 <= 1
+
+
+def make_pattern(width, height, pattern, index=0, rng=None):
+    rng = rng or np.random.default_rng(index)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    rgb = np.empty((height, width, 3), np.uint8)
+
+    if pattern == "gradient":
+        rgb[..., 0] = x
+        rgb[..., 1] = y
+        rgb[..., 2] = 128
+    elif pattern == "bars":
+        colors = np.array(
+            [
+                (255, 255, 255),
+                (255, 255, 0),
+                (0, 255, 255),
+                (0, 255, 0),
+                (255, 0, 255),
+                (255, 0, 0),
+                (0, 0, 255),
+                (0, 0, 0),
+            ],
+            np.uint8,
+        )
+        rgb[:] = colors[np.arange(width) * len(colors) // width]
+    elif pattern == "noise":
+        rgb[:] = rng.integers(0, 256, rgb.shape, dtype=np.uint8)
+    elif pattern == "moving":
+        # A bright disc moving over a gradient with mild sensor noise.
+        rgb[..., 0] = x
+        rgb[..., 1] = y
+        rgb[..., 2] = 96
+        cx = width * (0.3 + 0.4 * (index % 30) / 30)
+        cy, radius = height / 2, height / 5
+        disc = (np.arange(width) - cx) ** 2 + (np.arange(height)[:, None] - cy) ** 2
+        rgb[disc <= radius**2] = (230, 200, 170)
+        noise = rng.integers(-8, 9, rgb.shape, dtype=np.int16)
+        rgb[:] = np.clip(rgb + noise, 0, 255)
+    elif pattern == "face":
+        # A skin-toned head with hair, eyes and mouth in front of a bluish
+        # wall, for the face tracker.
+        rgb[..., 0] = 40 + x * 0.3
+        rgb[..., 1] = 60 + y * 0.3
+        rgb[..., 2] = 150
+        cx, cy, rx, ry = face_position(width, height, index)
+        rgb[ellipse(width, height, cx, cy - ry * 0.15, rx * 1.1, ry)] = (50, 35, 25)
+        rgb[ellipse(width, height, cx, cy, rx, ry)] = (224, 172, 140)
+        for eye_x in (cx - rx * 0.4, cx + rx * 0.4):
+            eye = ellipse(width, height, eye_x, cy - ry * 0.2, rx * 0.18, ry * 0.08)
+            rgb[eye] = (45, 35, 30)
+        mouth = ellipse(width, height, cx, cy + ry * 0.5, rx * 0.4, ry * 0.07)
+        rgb[mouth] = (150, 60, 60)
+        noise = rng.integers(-6, 7, rgb.shape, dtype=np.int16)
+        rgb[:] = np.clip(rgb + noise, 0, 255)
+    else:
+        raise ValueError(f"Unknown pattern: {pattern}")
+
+    return rgb
+
+
+def video_frame_from_bytes(data, width, height, bytes_per_line, pixel_format):
+    frame = QVideoFrame(data.nbytes, QSize(width, height), bytes_per_line, pixel_format)
+    frame.map(QAbstractVideoBuffer.WriteOnly)
+    bits = frame.bits()
+    bits.setsize(data.nbytes)
+    np.frombuffer(bits, np.uint8)[:] = data.ravel()
+    frame.unmap()
+    return frame
+
+
+def video_frame_from_rgb(rgb, pixel_format=QVideoFrame.Format_RGB32):
+    height, width = rgb.shape[:2]
+
+    if pixel_format == QVideoFrame.Format_YUYV:
+        return video_frame_from_bytes(
+            pack_yuyv(rgb), width, height, width * 2, pixel_format
+        )
+
+    if pixel_format == QVideoFrame.Format_NV12:
+        return video_frame_from_bytes(
+            pack_nv12(rgb), width, height, width, pixel_format
+        )
+
+    if pixel_format != QVideoFrame.Format_RGB32:
+        raise ValueError(f"Unsupported synthetic pixel format: {pixel_format}")
+
+    image = QImage(width, height, QImage.Format_RGB32)
+    pixels = image_to_array(image, writable=True)
+    b, g, r, a = RGB32_CHANNELS
+    pixels[..., r] = rgb[..., 0]
+    pixels[..., g] = rgb[..., 1]
+    pixels[..., b] = rgb[..., 2]
+    pixels[..., a] = 255
+    return QVideoFrame(image)
+
+
+class SyntheticFrameSource(TimedFrameSource):
+    # Frames are rendered when first due and looped afterwards, so the first
+    # one is out without waiting for the whole loop.
+    def __init__(
+        self,
+        width=1280,
+        height=720,
+        fps=30,
+        pixel_format=QVideoFrame.Format_RGB32,
+        pattern="moving",
+        frame_count=30,
+        seed=0,
+        parent=None,
+    ):
+        if pattern not in PATTERNS:
+            raise ValueError(f"Unknown pattern: {pattern}")
+
+        super().__init__([None] * frame_count, fps, parent)
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.pattern = pattern
+        self.rng = np.random.default_rng(seed)
+
+    def render(self, index):
+        if self.frames[index] is None:
+            rgb = make_pattern(self.width, self.height, self.pattern, index, self.rng)
+            self.frames[index] = video_frame_from_rgb(rgb, self.pixel_format)
+        return self.frames[index]
+
+    def prerender(self):
+        # For measurements that must not include the rendering.
+        for index in range(len(self.frames)):
+            self.render(index)
+
+    def next_frame(self):
+        self.render(self.index % len(self.frames))
+        return super().next_frame()
+
+
+def read_images(path):
+    path = Path(path)
+    files = sorted(path.iterdir()) if path.is_dir() else [path]
+
+    for file in files:
+        reader = QImageReader(str(file))
+        while reader.canRead():
+            image = reader.read()
+            if image.isNull():
+                break
+            yield image.convertToFormat(QImage.Format_RGB32)
+
+
+class ReplayFrameSource(TimedFrameSource):
+    # Replays an image file (every frame of an animated one) or a directory
+    # of images in name order.
+    def __init__(self, path, fps=30, parent=None):
+        frames = [QVideoFrame(image) for image in read_images(path)]
+        if not frames:
+            raise ValueError(f"No frames could be read from {path}")
+        super().__init__(frames, fps, parent)
@@ -0,0 +1,72 @@
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class FrameMailbox:
+    # Single slot handoff: a new frame replaces the one that was not taken
+    # yet, so a slow consumer only ever sees the latest frame.
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.posted = 0
+        self.dropped = 0
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, item):
+        with self._condition:
+            if self._closed:
+                return
+
+            if self._item is not None:
+                self.dropped += 1
+
+            self._item = item
+            self.posted += 1
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        with self._condition:
+            if self._item is None and not self._closed:
+                self._condition.wait(timeout)
+
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._item = None
+            self._condition.notify_all()
+
+
+class FrameWorker(QThread):
+    frame_processed = pyqtSignal(object, object, float)
+
+    def __init__(self, process, parent=None):
+        super().__init__(parent)
+        self.process = process
+        self.mailbox = FrameMailbox()
+
+    def submit(self, job):
+        self.mailbox.put(job)
+
+    def run(self):
+        while not self.mailbox.closed:
+            job = self.mailbox.take()
+            if job is None:
+                continue
+
+            for result in self.process(*job):
+                self.frame_processed.emit(*result)
+
+            # Don't keep the frame buffer alive while waiting for the next one.
+            job = None
+
+    def stop(self):
+        self.mailbox.close()
+        self.wait()
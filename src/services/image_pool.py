@@ -0,0 +1,112 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+from PyQt5.QtGui import QImage
+
+
+class ImagePool:
+    # Reuses working images of the frame pipeline. Images are acquired on the
+    # worker thread and released on the GUI thread, hence the lock. Only
+    # images handed out by the pool and released within the same generation
+    # are taken back, so releasing any other image is harmless.
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.returned = 0
+        self.discarded = 0
+
+        self._lock = threading.RLock()
+        self._idle = OrderedDict()
+        self._idle_count = 0
+        self._lent = {}
+
+    def __len__(self):
+        return self._idle_count
+
+    def acquire(self, width, height, image_format=QImage.Format_RGB32):
+        key = (width, height, image_format)
+        with self._lock:
+            images = self._idle.get(key)
+            if images:
+                image = images.pop()
+                self._idle_count -= 1
+                self._idle.move_to_end(key)
+                self.hits += 1
+            else:
+                image = QImage(width, height, image_format)
+                self.misses += 1
+
+            self._lent[id(image)] = (
+                weakref.ref(image, self._forget(id(image))),
+                key,
+                self.generation,
+            )
+        return image
+
+    def _forget(self, image_id):
+        def forget(reference):
+            with self._lock:
+                if self._lent.get(image_id, (None,))[0] is reference:
+                    del self._lent[image_id]
+
+        return forget
+
+    def release(self, image):
+        with self._lock:
+            lent = self._lent.get(id(image))
+            if lent is None or lent[0]() is not image:
+                return False
+            del self._lent[id(image)]
+
+            _, key, generation = lent
+            if generation != self.generation:
+                self.discarded += 1
+                return False
+
+            # Drop the least recently used sizes first when over capacity.
+            self._idle.setdefault(key, []).append(image)
+            self._idle.move_to_end(key)
+            self._idle_count += 1
+            while self._idle_count > self.capacity:
+                oldest = next(iter(self._idle))
+                self._idle[oldest].pop(0)
+                if not self._idle[oldest]:
+                    del self._idle[oldest]
+                self._idle_count -= 1
+                self.discarded += 1
+
+            self.returned += 1
+            return True
+
+    def discard(self, width, height):
+        # Drops the idle images of one size, e.g. the outputs of a window that
+        # was resized or moved to another screen.
+        with self._lock:
+            for key in [key for key in self._idle if key[:2] == (width, height)]:
+                images = self._idle.pop(key)
+                self._idle_count -= len(images)
+                self.discarded += len(images)
+
+    def clear(self):
+        # Images lent out before a clear are dropped when they come back.
+        with self._lock:
+            self.generation += 1
+            self._idle.clear()
+            self._idle_count = 0
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "capacity": self.capacity,
+                "idle": self._idle_count,
+                "lent": len(self._lent),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+                "returned": self.returned,
+                "discarded": self.discarded,
+            }
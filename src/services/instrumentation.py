@@ -0,0 +1,112 @@
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from services.singleton import SingletonMeta
+
+
+NULL_TIMER = nullcontext()
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(int(len(sorted_samples) * fraction), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+class LatencyHistogram:
+    # Keeps only the last `capacity` samples, so percentiles describe the
+    # recent behaviour and memory stays constant in long sessions.
+    def __init__(self, capacity=1024):
+        self.samples = deque(maxlen=capacity)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        samples = sorted(self.samples)
+        to_ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            "count": self.count,
+            "mean_ms": to_ms(self.total / self.count if self.count else 0.0),
+            "p50_ms": to_ms(percentile(samples, 0.50)),
+            "p95_ms": to_ms(percentile(samples, 0.95)),
+            "p99_ms": to_ms(percentile(samples, 0.99)),
+            "max_ms": to_ms(samples[-1] if samples else 0.0),
+        }
+
+
+class StageTimer:
+    def __init__(self, instrumentation, stage):
+        self.instrumentation = instrumentation
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.record(self.stage, time.perf_counter() - self.start)
+
+
+class Instrumentation(metaclass=SingletonMeta):
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.enabled = False
+        self.reset()
+
+    def enable(self, enabled=True):
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages.setdefault(stage, LatencyHistogram(self.capacity))
+        histogram.add(seconds)
+
+    def measure(self, stage):
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, stage)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "enabled": self.enabled,
+            "elapsed_s": round(elapsed, 3),
+            "stages": {
+                stage: histogram.summary()
+                for stage, histogram in list(self.stages.items())
+            },
+            "counters": dict(self.counters),
+            "fps": {
+                name: round(value / elapsed, 2)
+                for name, value in list(self.counters.items())
+            },
+        }
+
+    def dump(self, path, extra=None):
+        data = self.summary()
+        data.update(extra or {})
+        with open(path, "w") as file:
+            json.dump(data, file, indent=4)
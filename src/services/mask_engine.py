@@ -0,0 +1,214 @@
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QBrush, QImage, QPainter
+
+from services.numpy_frames import apply_alpha, circle_alpha, crop_image
+
+
+MASK_THEN_SCALE = "mask_then_scale"
+SCALE_THEN_MASK = "scale_then_mask"
+PIPELINE_MODES = (MASK_THEN_SCALE, SCALE_THEN_MASK)
+
+# Formats whose opaque pixels are already premultiplied ARGB.
+OPAQUE_PREMULTIPLIED = (QImage.Format_RGB32, QImage.Format_ARGB32_Premultiplied)
+
+QPAINTER_BACKEND = "qpainter"
+NUMPY_BACKEND = "numpy"
+BACKENDS = (QPAINTER_BACKEND, NUMPY_BACKEND)
+
+
+def to_rect(rect):
+    return QRect(
+        int(rect.x()),
+        int(rect.y()),
+        int(rect.width()),
+        int(rect.height()),
+    )
+
+
+def mask_image_painter(image, size, rect, device_pixel_ratio=1.0):
+    # Reference path: paints the ellipse at crop resolution on every frame
+    # and only then rescales the result to the output size.
+    rect = to_rect(rect)
+    image = image.copy(rect)
+
+    out_img = QImage(rect.width(), rect.height(), QImage.Format_ARGB32)
+    out_img.fill(Qt.transparent)
+
+    painter = QPainter(out_img)
+    painter.setBrush(QBrush(image))
+    painter.setPen(Qt.NoPen)
+    painter.drawEllipse(0, 0, rect.width(), rect.height())
+    painter.end()
+
+    size = int(size * device_pixel_ratio)
+    out_img = out_img.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    out_img.setDevicePixelRatio(device_pixel_ratio)
+    return out_img
+
+
+def create_circle_mask(width, height):
+    mask = QImage(width, height, QImage.Format_ARGB32_Premultiplied)
+    mask.fill(Qt.transparent)
+
+    painter = QPainter(mask)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setBrush(Qt.black)
+    painter.setPen(Qt.NoPen)
+    painter.drawEllipse(0, 0, width, height)
+    painter.end()
+
+    return mask
+
+
+def create_circle_alpha(width, height):
+    return circle_alpha(create_circle_mask(width, height))
+
+
+class MaskCache:
+    def __init__(self, capacity=4, factory=create_circle_mask):
+        self.capacity = capacity
+        self.factory = factory
+        self.hits = 0
+        self.misses = 0
+        self._masks = OrderedDict()
+        # Shared by the workers of all cameras.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._masks)
+
+    def get(self, width, height, device_pixel_ratio):
+        key = (width, height, device_pixel_ratio)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                self.hits += 1
+                return mask
+
+            self.misses += 1
+            mask = self.factory(width, height)
+            self._masks[key] = mask
+            if len(self._masks) > self.capacity:
+                self._masks.popitem(last=False)
+
+            return mask
+
+    def clear(self):
+        with self._lock:
+            self._masks.clear()
+
+
+class MaskEngine:
+    def __init__(
+        self,
+        cache_capacity=4,
+        mode=SCALE_THEN_MASK,
+        backend=QPAINTER_BACKEND,
+        pool=None,
+    ):
+        self.pool = pool
+        self.cache = MaskCache(cache_capacity)
+        self.alpha_cache = MaskCache(cache_capacity, factory=create_circle_alpha)
+        self.mode = mode
+        self.backend = backend
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode: {mode}")
+        self._mode = mode
+
+    @property
+    def backend(self):
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown mask backend: {backend}")
+        self._backend = backend
+
+    def clear(self):
+        self.cache.clear()
+        self.alpha_cache.clear()
+
+    def apply_mask(self, image, device_pixel_ratio=1.0):
+        # Keep only the pixels covered by the cached circle alpha.
+        mask = self.cache.get(image.width(), image.height(), device_pixel_ratio)
+
+        painter = QPainter(image)
+        painter.setCompositionMode(QPainter.CompositionMode_DestinationIn)
+        painter.drawImage(0, 0, mask)
+        painter.end()
+
+        return image
+
+    def crop(self, image, rect):
+        # Images cropped natively by DecodedFrame are already the crop. Other
+        # crops are views on the frame, valid only while the frame is alive.
+        rect = to_rect(rect)
+        if rect != image.rect():
+            image = crop_image(image, rect)
+        return image
+
+    def scale(self, image, size):
+        # Fast path: the crop already has the output size.
+        if max(image.width(), image.height()) == size:
+            return image
+
+        return image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    def acquire_output(self, width, height):
+        image_format = QImage.Format_ARGB32_Premultiplied
+        if self.pool is not None:
+            return self.pool.acquire(width, height, image_format)
+        return QImage(width, height, image_format)
+
+    def create_output(self, image):
+        # Copies into a premultiplied (pooled) buffer instead of allocating a
+        # converted image every frame.
+        output = self.acquire_output(image.width(), image.height())
+
+        painter = QPainter(output)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        painter.drawImage(0, 0, image)
+        painter.end()
+
+        return output
+
+    def mask(self, image, size, rect, device_pixel_ratio=1.0):
+        if self.mode == MASK_THEN_SCALE:
+            return mask_image_painter(image, size, rect, device_pixel_ratio)
+
+        size = int(size * device_pixel_ratio)
+
+        cropped = self.crop(image, rect)
+        image = self.scale(cropped, size)
+        if self.backend == NUMPY_BACKEND and image.format() in OPAQUE_PREMULTIPLIED:
+            image = self.mask_array(image, image is not cropped, device_pixel_ratio)
+        else:
+            image = self.create_output(image)
+            image = self.apply_mask(image, device_pixel_ratio)
+
+        image.setDevicePixelRatio(device_pixel_ratio)
+        return image
+
+    def mask_array(self, image, owned, device_pixel_ratio=1.0):
+        # Writes the masked pixels in one pass, into the scaled image when it
+        # is ours, else into an output buffer: no create_output copy.
+        width, height = image.width(), image.height()
+        alpha = self.alpha_cache.get(width, height, device_pixel_ratio)
+        if owned:
+            apply_alpha(image, alpha)
+            image.reinterpretAsFormat(QImage.Format_ARGB32_Premultiplied)
+            return image
+
+        return apply_alpha(image, alpha, self.acquire_output(width, height))
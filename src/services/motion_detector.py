@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+
+
+MOTION_THUMBNAIL_WIDTH = 64
+BLOCK_SIZE = 4
+
+
+def block_means(luma, block=BLOCK_SIZE):
+    # Averaging blocks of the thumbnail evens out sensor noise, while a
+    # small moving object still changes its own block.
+    height, width = (side - side % block for side in luma.shape)
+    blocks = luma[:height, :width].reshape(height // block, block, -1, block)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+class MotionDetector:
+    # Compares every frame against the last processed one, so slow drift
+    # adds up until it is shown. An unchanged scene is still refreshed every
+    # min_refresh_interval seconds. A threshold of 0 disables the detector.
+    # Consumers that skip frames keep a reference of their own by key, so a
+    # change they skipped is still shown on their next frame.
+    def __init__(self, threshold=6.0, min_refresh_interval=0.5):
+        self.threshold = threshold
+        self.min_refresh_interval = min_refresh_interval
+        self.changed = 0
+        self.unchanged = 0
+        self.refreshed = 0
+        self.reset()
+
+    def reset(self, key=None):
+        # Forces the next frame through, e.g. after the crop or size changed.
+        if key is None:
+            self.references = {}
+        else:
+            self.references.pop(key, None)
+
+    def has_changed(self, luma, now=None, key=None):
+        if not self.threshold:
+            return True
+
+        now = time.monotonic() if now is None else now
+        blocks = block_means(luma)
+        reference, last_processed = self.references.get(key, (None, 0.0))
+
+        if reference is None or reference.shape != blocks.shape:
+            self.changed += 1
+        elif np.abs(blocks - reference).max() > self.threshold:
+            self.changed += 1
+        elif now - last_processed >= self.min_refresh_interval:
+            self.refreshed += 1
+        else:
+            self.unchanged += 1
+            return False
+
+        self.references[key] = (blocks, now)
+        return True
+
+    def stats(self):
+        return {
+            "threshold": self.threshold,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "refreshed": self.refreshed,
+        }
@@ -0,0 +1,79 @@
+from collections import namedtuple
+
+import numpy as np
+
+from PyQt5 import sip
+from PyQt5.QtGui import QImage
+
+
+FORMATS_32BPP = (
+    QImage.Format_RGB32,
+    QImage.Format_ARGB32,
+    QImage.Format_ARGB32_Premultiplied,
+)
+
+
+def image_to_array(image, writable=False):
+    # Zero-copy (height, width, 4) view on 32-bit image pixels. Asking for a
+    # writable view detaches the image if its data is shared.
+    bits = image.bits() if writable else image.constBits()
+    bits.setsize(image.sizeInBytes())
+    return np.ndarray(
+        shape=(image.height(), image.width(), 4),
+        dtype=np.uint8,
+        buffer=bits,
+        strides=(image.bytesPerLine(), 4, 1),
+    )
+
+
+def array_to_image(array, image_format):
+    # The image points at the array memory, so the array must outlive it.
+    height, width = array.shape[:2]
+    return QImage(
+        sip.voidptr(array.ctypes.data), width, height, array.strides[0], image_format
+    )
+
+
+def crop_image(image, rect):
+    bounds = image.rect()
+    if image.format() not in FORMATS_32BPP or bounds.intersected(rect) != rect:
+        return image.copy(rect)
+
+    array = image_to_array(image)
+    view = array[rect.y() : rect.bottom() + 1, rect.x() : rect.right() + 1]
+    return array_to_image(view, image.format())
+
+
+CircleAlpha = namedtuple(
+    "CircleAlpha", ["inside", "rim_rows", "rim_columns", "rim_alpha"]
+)
+
+
+def circle_alpha(mask):
+    # Splits an anti-aliased mask into a bit mask of its opaque pixels and
+    # the few rim pixels that need a multiply.
+    alpha = image_to_array(mask)[..., 3]
+    inside = np.where(alpha == 255, np.uint32(0xFFFFFFFF), np.uint32(0))
+    rim_rows, rim_columns = np.nonzero((alpha > 0) & (alpha < 255))
+    rim_alpha = alpha[rim_rows, rim_columns, None].astype(np.uint16)
+    return CircleAlpha(inside, rim_rows, rim_columns, rim_alpha)
+
+
+def apply_alpha(image, alpha, output=None):
+    # Premultiplied pixels only need every channel scaled by the alpha. The
+    # opaque pixels are copied and the rest cleared in one pass, only the
+    # rim is multiplied. Without an output the image is masked in place.
+    if output is None:
+        source = target = image_to_array(image, writable=True)
+        output = image
+    else:
+        source = image_to_array(image)
+        target = image_to_array(output, writable=True)
+
+    rows, columns = alpha.rim_rows, alpha.rim_columns
+    rim = source[rows, columns]
+    np.bitwise_and(
+        source.view(np.uint32)[..., 0], alpha.inside, out=target.view(np.uint32)[..., 0]
+    )
+    target[rows, columns] = (rim * alpha.rim_alpha + 127) // 255
+    return output
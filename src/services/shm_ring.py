@@ -0,0 +1,284 @@
+import mmap
+import os
+import struct
+import tempfile
+import time
+from collections import namedtuple
+
+import numpy as np
+
+
+# Frames shared with other local processes through a memory-mapped file.
+# Only numpy is needed to read them, so readers don't have to load Qt.
+#
+# Layout, little endian:
+#   header (64 bytes): magic, version, slot count, slot size, max width,
+#       max height, pixel format, state, last committed sequence, writer pid
+#   slots: a 64 byte slot header (begin and end sequence, timestamp in
+#       CLOCK_MONOTONIC nanoseconds, width, height, stride) and the pixels
+#
+# One writer, any number of readers, no locks. The writer marks the slot
+# with the new sequence in `begin`, writes the pixels, then sets `end` and
+# finally the header sequence. A reader accepts a slot whose `end` matches
+# the sequence it wants and whose `begin` still matches after reading, so a
+# frame overwritten meanwhile is detected and retried. This relies on the
+# stores becoming visible in program order, as they do on x86.
+
+SHM_FOLDER = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+MAGIC = b"KOLORING"
+VERSION = 1
+RGBA8888 = 1
+
+OPEN = 1
+CLOSED = 2
+
+HEADER_FORMAT = "<8sIIQIIII"
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 64
+ALIGNMENT = 64
+
+# Word indices into the header and slot headers.
+SEQUENCE = 5
+STATE = 9
+WRITER_PID = 12
+BEGIN = 0
+END = 1
+TIMESTAMP = 2
+WIDTH = 6
+HEIGHT = 7
+STRIDE = 8
+
+RingFrame = namedtuple(
+    "RingFrame", ["sequence", "timestamp_ns", "width", "height", "pixels"]
+)
+
+
+def ring_path(name, folder=SHM_FOLDER):
+    if not name or os.sep in name:
+        raise ValueError(f"Invalid ring name {name!r}")
+    return os.path.join(folder, name)
+
+
+def align(size, alignment=ALIGNMENT):
+    return -(-size // alignment) * alignment
+
+
+class RingBuffer:
+    # The views shared by the writer and the readers.
+    def map(self, buffer):
+        self.buffer = buffer
+        (
+            magic,
+            version,
+            self.slot_count,
+            self.slot_size,
+            self.max_width,
+            self.max_height,
+            self.pixel_format,
+            _,
+        ) = struct.unpack_from(HEADER_FORMAT, buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a frame ring")
+        if self.pixel_format != RGBA8888:
+            raise ValueError(f"Unknown pixel format {self.pixel_format}")
+
+        self.header64 = np.ndarray(HEADER_SIZE // 8, np.uint64, buffer)
+        self.header32 = np.ndarray(HEADER_SIZE // 4, np.uint32, buffer)
+        slots = (self.slot_count, self.slot_size // 8)
+        self.slots64 = np.ndarray(slots, np.uint64, buffer, HEADER_SIZE)
+        slots = (self.slot_count, self.slot_size // 4)
+        self.slots32 = np.ndarray(slots, np.uint32, buffer, HEADER_SIZE)
+        self.stride = self.max_width * 4
+        self.pixels = np.ndarray(
+            (self.slot_count, self.max_height, self.max_width, 4),
+            np.uint8,
+            buffer,
+            HEADER_SIZE + SLOT_HEADER_SIZE,
+            (self.slot_size, self.stride, 4, 1),
+        )
+
+    def unmap(self):
+        # The mapping can only be closed once no view exports it any more.
+        self.header64 = self.header32 = self.slots64 = self.slots32 = None
+        self.pixels = None
+        try:
+            self.buffer.close()
+        except BufferError:
+            # Frames read without a copy still point into it, the mapping
+            # goes away with the last of them.
+            pass
+        self.buffer = None
+
+    @property
+    def sequence(self):
+        return int(self.header64[SEQUENCE])
+
+    @property
+    def closed(self):
+        return self.buffer is None or self.header32[STATE] != OPEN
+
+
+class RingWriter(RingBuffer):
+    def __init__(self, name, max_width, max_height, slots=4, folder=SHM_FOLDER):
+        self.path = ring_path(name, folder)
+        slot_size = SLOT_HEADER_SIZE + align(max_height * max_width * 4)
+        size = HEADER_SIZE + slots * slot_size
+
+        # Built aside and renamed, so readers never map a half-written header.
+        temporary = f"{self.path}.{os.getpid()}"
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            buffer = mmap.mmap(fd, size)
+            self.inode = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+
+        header = (MAGIC, VERSION, slots, slot_size, max_width, max_height, RGBA8888)
+        struct.pack_into(HEADER_FORMAT, buffer, 0, *header, OPEN)
+        self.map(buffer)
+        self.header32[WRITER_PID] = os.getpid()
+        os.replace(temporary, self.path)
+
+        self.written = 0
+
+    def begin(self):
+        # Returns the pixels of the next slot. Readers stop trusting the
+        # frame it held from here on.
+        sequence = self.sequence + 1
+        slot = sequence % self.slot_count
+        self.slots64[slot, BEGIN] = sequence
+        return self.pixels[slot]
+
+    def commit(self, width, height, timestamp_ns=None):
+        sequence = self.sequence + 1
+        slot = sequence % self.slot_count
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+
+        self.slots64[slot, TIMESTAMP] = timestamp_ns
+        self.slots32[slot, WIDTH] = width
+        self.slots32[slot, HEIGHT] = height
+        self.slots32[slot, STRIDE] = self.stride
+        self.slots64[slot, END] = sequence
+        self.header64[SEQUENCE] = sequence
+        self.written += 1
+        return sequence
+
+    def write(self, rgba, timestamp_ns=None):
+        height, width = rgba.shape[:2]
+        self.begin()[:height, :width] = rgba
+        return self.commit(width, height, timestamp_ns)
+
+    def close(self, unlink=True):
+        if self.buffer is None:
+            return
+
+        self.header32[STATE] = CLOSED
+        self.unmap()
+        if unlink:
+            # Another writer may have taken the name over meanwhile.
+            try:
+                if os.stat(self.path).st_ino == self.inode:
+                    os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "size": [self.max_width, self.max_height],
+            "slots": self.slot_count,
+            "written": self.written,
+        }
+
+
+class RingReader(RingBuffer):
+    # Follows a ring by name, also across the writer recreating it, e.g.
+    # when the circle grows.
+    def __init__(self, name, folder=SHM_FOLDER, retries=3):
+        self.path = ring_path(name, folder)
+        self.retries = retries
+        self.buffer = None
+        self.frames = 0
+        self.retried = 0
+        self.reopened = 0
+        self.open()
+
+    def open(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            buffer = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        self.map(buffer)
+
+    def reopen(self):
+        if self.buffer is not None:
+            self.unmap()
+        try:
+            self.open()
+        except (FileNotFoundError, ValueError):
+            return False
+        self.reopened += 1
+        return True
+
+    def read(self, sequence, copy=True):
+        # Returns the frame of that sequence, or None once overwritten. A
+        # frame read without a copy is only valid while is_intact says so.
+        slot = sequence % self.slot_count
+        if self.slots64[slot, END] != sequence:
+            return None
+
+        timestamp_ns = int(self.slots64[slot, TIMESTAMP])
+        width = int(self.slots32[slot, WIDTH])
+        height = int(self.slots32[slot, HEIGHT])
+        pixels = self.pixels[slot, :height, :width]
+        if copy:
+            pixels = pixels.copy()
+
+        if self.slots64[slot, BEGIN] != sequence:
+            return None
+        return RingFrame(sequence, timestamp_ns, width, height, pixels)
+
+    def latest(self, copy=True):
+        if self.closed and not self.reopen():
+            return None
+
+        for _ in range(self.retries):
+            sequence = self.sequence
+            if not sequence:
+                return None
+
+            frame = self.read(sequence, copy)
+            if frame is not None:
+                self.frames += 1
+                return frame
+            self.retried += 1
+        return None
+
+    def wait(self, after, timeout=1.0, interval=0.001):
+        # Polls until a frame newer than `after` is committed.
+        deadline = time.monotonic() + timeout
+        while not self.closed and self.sequence <= after:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+    def is_intact(self, frame):
+        return self.slots64[frame.sequence % self.slot_count, BEGIN] == frame.sequence
+
+    def close(self):
+        if self.buffer is not None:
+            self.unmap()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "frames": self.frames,
+            "retried": self.retried,
+            "reopened": self.reopened,
+        }
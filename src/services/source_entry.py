@@ -0,0 +1,67 @@
+import time
+
+
+class SourceEntry:
+    # Rate limiting tolerates frames that arrive slightly early, otherwise a
+    # 15 fps source fed by a jittery 30 fps camera would drop to 10 fps.
+    EARLY_TOLERANCE = 0.25
+
+    def __init__(self, process, size=None, fps=None, display=None):
+        self.process = process
+        self.size = size
+        self.fps = fps
+        self.display = display
+
+        self.delivered = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.hidden = 0
+        self._next_due = 0.0
+
+    @property
+    def fps(self):
+        return self._fps
+
+    @fps.setter
+    def fps(self, fps):
+        self._fps = fps
+        self._interval = 1 / fps if fps else 0.0
+        self._next_due = 0.0
+
+    def is_due(self, now=None):
+        if not self._interval:
+            return True
+
+        now = time.monotonic() if now is None else now
+        if now + self._interval * self.EARLY_TOLERANCE < self._next_due:
+            return False
+
+        self._next_due = max(self._next_due, now - self._interval) + self._interval
+        return True
+
+    def schedule(self, is_visible, now=None):
+        if not is_visible:
+            self.hidden += 1
+            return False
+
+        if not self.is_due(now):
+            self.skipped += 1
+            return False
+        return True
+
+    def deliver(self, changed=True):
+        # A scheduled frame is only delivered if it shows something new.
+        if changed:
+            self.delivered += 1
+        else:
+            self.unchanged += 1
+        return changed
+
+    def stats(self):
+        return {
+            "fps": self.fps,
+            "delivered": self.delivered,
+            "unchanged": self.unchanged,
+            "skipped": self.skipped,
+            "hidden": self.hidden,
+        }
@@ -0,0 +1,54 @@
+import math
+from collections import namedtuple
+
+
+ViewfinderMode = namedtuple(
+    "ViewfinderMode",
+    ["width", "height", "min_fps", "max_fps", "pixel_format"],
+    defaults=[None],
+)
+
+
+def parse_resolution(value):
+    # "1280x720" -> (1280, 720), empty or malformed values mean "automatic".
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except (AttributeError, ValueError):
+        return None
+    return (width, height)
+
+
+def required_frame_side(output_size, crop_fraction=1.0, device_pixel_ratio=1.0):
+    # The crop covers crop_fraction of the short frame side and still has to
+    # provide output_size device pixels after scaling.
+    crop_fraction = min(max(crop_fraction, 1e-3), 1.0)
+    return math.ceil(output_size * device_pixel_ratio / crop_fraction)
+
+
+def select_frame_rate(modes, fps):
+    # The slowest mode that still reaches fps, otherwise the fastest one.
+    fast_enough = [mode for mode in modes if mode.max_fps >= fps]
+    if fast_enough:
+        return min(fast_enough, key=lambda mode: mode.max_fps)
+    return max(modes, key=lambda mode: mode.max_fps)
+
+
+def select_viewfinder_mode(modes, required_side, fps, resolution=None):
+    modes = list(modes)
+    if not modes:
+        return None
+
+    if resolution is not None:
+        matching = [mode for mode in modes if (mode.width, mode.height) == resolution]
+        if matching:
+            return select_frame_rate(matching, fps)
+
+    covering = [mode for mode in modes if min(mode.width, mode.height) >= required_side]
+    if not covering:
+        # Nothing is large enough, so take the largest resolution there is.
+        largest = max(mode.width * mode.height for mode in modes)
+        covering = [mode for mode in modes if mode.width * mode.height == largest]
+
+    smallest = min(mode.width * mode.height for mode in covering)
+    candidates = [mode for mode in covering if mode.width * mode.height == smallest]
+    return select_frame_rate(candidates, fps)
@@ -0,0 +1,156 @@
+import sys
+
+import numpy as np
+
+from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QImage
+
+from services.numpy_frames import image_to_array
+
+
+# Byte positions of B, G, R, A inside a Format_RGB32 pixel.
+if sys.byteorder == "little":
+    RGB32_CHANNELS = (0, 1, 2, 3)
+else:
+    RGB32_CHANNELS = (3, 2, 1, 0)
+
+
+def align_rect(rect):
+    # Chroma is shared by 2x2 (NV12) or 2x1 (YUYV) pixels, so the crop has
+    # to start and end on even coordinates.
+    x, y = rect.x() & ~1, rect.y() & ~1
+    right = (rect.x() + rect.width() + 1) & ~1
+    bottom = (rect.y() + rect.height() + 1) & ~1
+    return QRect(x, y, right - x, bottom - y)
+
+
+def plane_rows(plane, stride, height):
+    return plane[: stride * height].reshape(height, stride)
+
+
+def _crop_packed(plane, stride, height, rect, y_offset, u_offset, v_offset):
+    rows = plane_rows(plane, stride, height)
+    x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
+    macropixels = rows[y : y + h, 2 * x : 2 * (x + w)].reshape(h, w // 2, 4)
+
+    luma = macropixels[..., [y_offset, y_offset + 2]].reshape(h, w)
+    return luma, macropixels[..., u_offset], macropixels[..., v_offset]
+
+
+def crop_yuyv(planes, strides, height, rect):
+    return _crop_packed(planes[0], strides[0], height, rect, 0, 1, 3)
+
+
+def crop_uyvy(planes, strides, height, rect):
+    return _crop_packed(planes[0], strides[0], height, rect, 1, 0, 2)
+
+
+def _crop_semi_planar(planes, strides, height, rect, u_offset, v_offset):
+    x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
+    luma = plane_rows(planes[0], strides[0], height)[y : y + h, x : x + w]
+
+    chroma = plane_rows(planes[1], strides[1], height // 2)
+    chroma = chroma[y // 2 : (y + h) // 2, x : x + w].reshape(h // 2, w // 2, 2)
+    return luma, chroma[..., u_offset], chroma[..., v_offset]
+
+
+def crop_packed_bytes(planes, strides, height, rect):
+    # The crop of a YUYV or UYVY frame as a contiguous frame of its own.
+    x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
+    rows = plane_rows(planes[0], strides[0], height)
+    return np.ascontiguousarray(rows[y : y + h, 2 * x : 2 * (x + w)]), w * 2
+
+
+def crop_semi_planar_bytes(planes, strides, height, rect):
+    # The crop of an NV12 or NV21 frame, luma rows followed by chroma rows.
+    x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
+    luma = plane_rows(planes[0], strides[0], height)[y : y + h, x : x + w]
+    chroma = plane_rows(planes[1], strides[1], height // 2)
+    chroma = chroma[y // 2 : (y + h) // 2, x : x + w]
+    return np.concatenate((luma, chroma)), w
+
+
+def crop_nv12(planes, strides, height, rect):
+    return _crop_semi_planar(planes, strides, height, rect, 0, 1)
+
+
+def crop_nv21(planes, strides, height, rect):
+    return _crop_semi_planar(planes, strides, height, rect, 1, 0)
+
+
+# BT.601 limited range in 8.8 fixed point, as lookup tables.
+_levels = np.arange(256, dtype=np.int32)
+LUMA_TABLE = 298 * (_levels - 16) + 128
+RED_V_TABLE = 409 * (_levels - 128)
+GREEN_U_TABLE = -100 * (_levels - 128)
+GREEN_V_TABLE = -208 * (_levels - 128)
+BLUE_U_TABLE = 516 * (_levels - 128)
+
+
+def yuv_to_image(luma, u, v, pool=None):
+    # Chroma may be subsampled; the contributions are computed at chroma
+    # resolution and broadcast over the luma block each sample covers.
+    height, width = luma.shape
+    rows, columns = u.shape
+    block = (rows, height // rows, columns, width // columns)
+
+    if pool is not None:
+        image = pool.acquire(width, height, QImage.Format_RGB32)
+    else:
+        image = QImage(width, height, QImage.Format_RGB32)
+    pixels = image_to_array(image, writable=True)
+    blocks = pixels.reshape(*block, 4)
+    luma = LUMA_TABLE[luma].reshape(block)
+
+    b, g, r, a = RGB32_CHANNELS
+    chroma = (
+        (r, RED_V_TABLE[v]),
+        (g, GREEN_U_TABLE[u] + GREEN_V_TABLE[v]),
+        (b, BLUE_U_TABLE[u]),
+    )
+    for channel, contribution in chroma:
+        value = luma + contribution[:, None, :, None]
+        value >>= 8
+        np.clip(value, 0, 255, out=value)
+        blocks[..., channel] = value
+    pixels[..., a] = 255
+
+    return image
+
+
+def rgb_to_yuv(rgb):
+    # BT.601 limited range, full resolution planes from an (h, w, 3) array.
+    r, g, b = (rgb[..., channel].astype(np.int32) for channel in range(3))
+    luma = 16 + ((66 * r + 129 * g + 25 * b + 128) >> 8)
+    u = 128 + ((-38 * r - 74 * g + 112 * b + 128) >> 8)
+    v = 128 + ((112 * r - 94 * g - 18 * b + 128) >> 8)
+    return luma.astype(np.uint8), u, v
+
+
+def pack_yuyv(rgb):
+    luma, u, v = rgb_to_yuv(rgb)
+    height, width = luma.shape
+
+    packed = np.empty((height, width // 2, 4), np.uint8)
+    packed[..., 0] = luma[:, 0::2]
+    packed[..., 1] = (u[:, 0::2] + u[:, 1::2] + 1) // 2
+    packed[..., 2] = luma[:, 1::2]
+    packed[..., 3] = (v[:, 0::2] + v[:, 1::2] + 1) // 2
+    return packed.reshape(height, width * 2)
+
+
+def subsample_2x2(plane):
+    total = plane[0::2, 0::2] + plane[0::2, 1::2] + plane[1::2, 0::2]
+    return (total + plane[1::2, 1::2] + 2) // 4
+
+
+def pack_nv12(rgb):
+    luma, u, v = rgb_to_yuv(rgb)
+    height, width = luma.shape
+
+    packed = np.empty((height * 3 // 2, width), np.uint8)
+    packed[:height] = luma
+    chroma = packed[height:].reshape(height // 2, width // 2, 2)
+    chroma[..., 0] = subsample_2x2(u)
+    chroma[..., 1] = subsample_2x2(v)
+    return packed